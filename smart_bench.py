@@ -0,0 +1,721 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+""" benchmarks for smart_graphic.py
+
+    smart_bench.py generate DIR [--disks N] [--samples M] [--interval HOURS] ...
+
+        generates a fake /var/log/smart tree: DIR/<Serial Number>/YYYY-MM-DD_HHMM.txt,
+        N disks x M samples, from the SMART_DATA_EXAMPLE template. Attribute values
+        drift over time (some disks are degrading), some disks have wider columns
+        and some logs may be malformed. With --json, some disks are logged as
+        smartctl -j JSON (YYYY-MM-DD_HHMM.json), some of them NVMe with --nvme.
+
+    smart_bench.py run DIR [--jobs N] [--renders K]
+
+        reports ingestion throughput (logs per second, without then with the
+        parsed-sample cache, serial then parallel), rendering time (seconds per
+        figure, batch mode) and peak RSS.
+
+    smart_bench.py formats [--disks N] [--samples M]
+
+        ingestion throughput of the same fake disks logged as text, then as
+        smartctl -j JSON (best of alternate rounds, after a warm-up), and
+        whether both give the same samples.
+
+    smart_bench.py serve [--disks N] [--samples M] [--scrapes K]
+
+        smart_graphic.py --serve index of a generated tree: time to build it,
+        time per /metrics and /json request of a local client, and time to
+        update it with a new log.
+
+    smart_bench.py compact [--disks N] [--samples M]
+
+        round trip of smart_graphic.py --compact on a generated tree: time to
+        compact it, then whether the samples read back from the aggregates are
+        those of the original logs and the --json summaries are unchanged (exit
+        status 1 otherwise).
+
+    smart_bench.py smartctl [--scan | [--json=o] -iAH --nocheck=standby DISK]
+
+        fake smartctl, e.g. to run smart_collector.py without any real disk.
+
+    smart_bench.py parser [--rows N]
+
+        micro-benchmark of the attribute table parser: rows per second of the
+        header-driven parser of smart_graphic.py, compared with the former
+        fixed-width slicing parser (kept below as reference).
+
+Example:
+
+    smart_bench.py generate /tmp/smart --disks 60 --samples 2000
+    smart_bench.py run      /tmp/smart --jobs 8
+
+This program is free software: you can redistribute it and/or modify it under
+the terms of the GNU General Public License as published by the Free Software
+Foundation, either version 3 of the License, or (at your option) any later
+version.
+
+This program is distributed in the hope that it will be useful, but WITHOUT
+ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS
+FOR A PARTICULAR PURPOSE. See the GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License along with
+this program. If not, see <http://www.gnu.org/licenses/>.
+"""
+
+__author__     = "Daniel Exbrayat"
+__copyright__  = "Copyright 2023, personal"
+__date__       = "2023/08/02"
+__email__      = "daniel.exbrayat@laposte.net"
+__license__    = "GPLv3"
+__status__     = "Prototype"    # ['Prototype', 'Development', 'Production']
+__version__    = "0.1.0"
+
+import os
+import sys
+import time
+import random
+import shutil
+import resource
+import argparse
+import tempfile
+import json
+import urllib.request
+
+import smart_graphic as sg
+
+#======================================================================
+# Former fixed-width parser of smart_graphic.py, only kept as a reference
+
+PATTERN_for_SLICING_SMART_DATA = \
+ 'xxx xxxxxxxxxxxxxxxxxxxxxxx xxxxxx   xxx   xxx   xxx    xxxxxxxxx xxxxxxxx xxxxxxxxxxx xxxxxxxxxxxxxx '
+
+def SMART_DATA_Slices(string):
+    i = j = 0
+    while i < len(string):
+        while string[i] == ' ':
+            i += 1
+        j = i+1
+        while string[j] != ' ':
+            j += 1
+        yield i,j
+        i = j+1
+
+SMART_DATA_SLICES = [ij for ij in SMART_DATA_Slices(PATTERN_for_SLICING_SMART_DATA)]
+
+SMART_DATA_HEADERS_str = [h for h in sg.SMART_DATA_EXAMPLE.splitlines() if 'ID# ' in h][0][2:]
+
+SMART_DATA_HEADERS = SMART_DATA_HEADERS_str.split()
+
+def SMART_DATA_Headers_and_Values(line):
+    for col_name,ij in zip(SMART_DATA_HEADERS, SMART_DATA_SLICES):
+        i,j = ij
+        value = line[i:j]
+
+        yield col_name, value.split()[0]
+
+def legacy_parse_SMART_DATA_ROWS(fp, smart_data):
+    for line_with_CRLF in fp:
+        line = line_with_CRLF.rstrip()
+
+        if len(line) < 1:
+            break
+
+        for col_name, value in SMART_DATA_Headers_and_Values(line):
+            if   col_name == 'ID#':
+                attribute_id = value
+
+            elif col_name in ['ATTRIBUTE_NAME', 'FLAG', 'TYPE', 'WHEN_FAILED']:
+                sg.create_dict(smart_data, col_name)
+
+                smart_data[col_name][attribute_id] = value
+
+            elif col_name in ['VALUE','WORST','THRESH','RAW_VALUE']:
+                sg.create_dict(smart_data, col_name)
+
+                sg.create_list(smart_data[col_name], attribute_id)
+
+                smart_data[col_name][attribute_id].append(int(value))
+
+#======================================================================
+def example_rows():
+    return [line[2:] + '\n' for line in sg.SMART_DATA_EXAMPLE.splitlines() if line.startswith('# ') and line[2:5].strip().isdigit()]
+
+def rows_per_second(parse, nb_rows):
+    rows = example_rows()
+    table = rows * (nb_rows // len(rows)) + ['\n']
+
+    start = time.perf_counter()
+    parse(table)
+    elapsed = time.perf_counter() - start
+
+    return (len(table) - 1) / elapsed
+
+def bench_parser(nb_rows):
+    header_line = SMART_DATA_HEADERS_str
+
+    legacy = rows_per_second(lambda table: legacy_parse_SMART_DATA_ROWS(iter(table), dict()), nb_rows)
+    header = rows_per_second(lambda table: sg.parse_SMART_DATA_ROWS(iter(table), header_line, sg.new_SMART_SAMPLE()), nb_rows)
+
+    print(f'fixed-width slicing parser : {legacy:12,.0f} rows/s')
+    print(f'header-driven parser       : {header:12,.0f} rows/s')
+    print(f'speed-up                   : {header / legacy:12.2f}')
+
+#======================================================================
+# Fake /var/log/smart tree
+
+# information section and attribute table of SMART_DATA_EXAMPLE, without the '# ' prefix
+EXAMPLE_LINES = [line[2:] for line in sg.SMART_DATA_EXAMPLE.splitlines() if line.startswith('# ')]
+
+EXAMPLE_INFORMATION = EXAMPLE_LINES[:EXAMPLE_LINES.index('=== START OF READ SMART DATA SECTION ===')]
+EXAMPLE_HEADER      = [line for line in EXAMPLE_LINES if line.startswith('ID# ')][0]
+EXAMPLE_ATTRIBUTES  = sg.parse_SMART_DATA_ROWS(iter(example_rows() + ['\n']), EXAMPLE_HEADER, sg.new_SMART_SAMPLE())
+
+# wider columns, as printed by some drives / smartctl versions
+WIDE_NAMES = {'5': 'Reallocated_Sector_Count_Total', '9': 'Power_On_Hours_and_Msec', '194': 'Temperature_Celsius_Internal'}
+
+def new_FAKE_DISK(index, rng, degrading, wide):
+    return {
+        'Serial Number': f'FAKE-{index:04d}-{rng.randrange(16**6):06X}',
+        'degrading'    : degrading,
+        'wide'         : wide,
+        'power_on'     : rng.randrange(100, 40000),
+        'load_cycles'  : rng.randrange(0, 200000),
+        'temperature'  : rng.randrange(25, 40),
+        'reallocated'  : 0,
+        'pending'      : 0,
+        'health'       : 200.0,     # VALUE of the degrading attributes
+    }
+
+def drift_FAKE_DISK(disk, rng, interval):
+    disk['power_on']    += interval
+    disk['load_cycles'] += rng.randrange(0, 3 * interval + 1)
+    disk['temperature']  = min(max(disk['temperature'] + rng.choice([-1, 0, 0, 1]), 18), 60)
+
+    if disk['degrading']:
+        if rng.random() < 0.05:
+            disk['reallocated'] += rng.randrange(1, 9)
+        disk['pending'] = rng.choice([0, 0, 0, 1, 2])
+        disk['health']  = max(disk['health'] - rng.random() * 0.1, 100)
+
+def FAKE_ATTRIBUTE(disk, attribute_id):
+    name   = EXAMPLE_ATTRIBUTES['ATTRIBUTE_NAME'][attribute_id]
+    flag   = EXAMPLE_ATTRIBUTES['FLAG'          ][attribute_id]
+    type   = EXAMPLE_ATTRIBUTES['TYPE'          ][attribute_id]
+    failed = EXAMPLE_ATTRIBUTES['WHEN_FAILED'   ][attribute_id]
+    value, worst, thresh, raw, _, _ = EXAMPLE_ATTRIBUTES['METRICS'][attribute_id]
+    raw_value = str(raw)
+
+    if   attribute_id == '9':
+        raw_value = str(disk['power_on'])
+        if disk['wide']:
+            raw_value += f'h+{disk["load_cycles"] % 60:02d}m+12.345s'
+    elif attribute_id == '193':
+        raw_value = str(disk['load_cycles'])
+    elif attribute_id == '194':
+        raw_value = str(disk['temperature'])
+        if disk['wide']:
+            raw_value += f' (Min/Max 18/{disk["temperature"] + 5})'
+        value = worst = 150 - disk['temperature']
+    elif attribute_id in ['5', '196']:
+        raw_value = str(disk['reallocated'])
+        value = worst = round(disk['health'])
+    elif attribute_id == '197':
+        raw_value = str(disk['pending'])
+
+    if disk['wide']:
+        name = WIDE_NAMES.get(attribute_id, name)
+
+    return name, flag, type, failed, value, worst, thresh, raw_value
+
+def FAKE_ATTRIBUTE_ROW(disk, attribute_id):
+    name, flag, type, failed, value, worst, thresh, raw_value = FAKE_ATTRIBUTE(disk, attribute_id)
+
+    return f'{attribute_id:>3} {name:<23} {flag}   {value:03d}   {worst:03d}   {thresh:03d}    ' \
+           f'{type:<9} Always   {failed:^11} {raw_value}'
+
+def FAKE_SMART_LOG(disk, date, malformed=False):
+    lines = []
+    for line in EXAMPLE_INFORMATION:
+        if   line.startswith('Serial Number:'):
+            line = f'Serial Number:    {disk["Serial Number"]}'
+        elif line.startswith('Local Time is:'):
+            line = f'Local Time is:    {time.strftime("%a %b %e %H:%M:%S %Y", time.gmtime(date))} UTC'
+        lines.append(line)
+
+    lines += ['=== START OF READ SMART DATA SECTION ===',
+              'SMART overall-health self-assessment test result: PASSED',
+              '',
+              'SMART Attributes Data Structure revision number: 16',
+              'Vendor Specific SMART Attributes with Thresholds:',
+              EXAMPLE_HEADER]
+    lines += [FAKE_ATTRIBUTE_ROW(disk, attribute_id) for attribute_id in EXAMPLE_ATTRIBUTES['METRICS']]
+    lines += ['', '']
+
+    if malformed:   # e.g. smartctl interrupted, or drive in standby
+        lines = lines[:len(lines) // 3]
+
+    return '\n'.join(lines)
+
+# same content as FAKE_SMART_LOG(), as output by smartctl -j (NVMe disks: JSON only)
+EXAMPLE_INFO = dict((name, value.strip()) for name, _, value in
+                    (line.partition(':') for line in EXAMPLE_INFORMATION) if value)
+
+JSON_WHEN_FAILED = {'-': '', 'FAILING_NOW': 'now', 'In_the_past': 'past'}
+
+def FAKE_ATTRIBUTE_JSON(disk, attribute_id):
+    name, flag, type, failed, value, worst, thresh, raw_value = FAKE_ATTRIBUTE(disk, attribute_id)
+
+    return {
+        'id'         : int(attribute_id),
+        'name'       : name,
+        'value'      : value,
+        'worst'      : worst,
+        'thresh'     : thresh,
+        'when_failed': JSON_WHEN_FAILED.get(failed, ''),
+        'flags'      : {'value': int(flag, 16), 'prefailure': type == 'Pre-fail'},
+        'raw'        : {'value': sg.parse_RAW_VALUE(raw_value)[0], 'string': raw_value},
+    }
+
+def FAKE_NVME_HEALTH(disk):
+    return {
+        'critical_warning'         : 0,
+        'temperature'              : disk['temperature'],
+        'available_spare'          : round(disk['health'] / 2),
+        'available_spare_threshold': 10,
+        'percentage_used'          : round(200 - disk['health']),
+        'data_units_read'          : disk['load_cycles'] * 1000,
+        'data_units_written'       : disk['load_cycles'] * 700,
+        'host_reads'               : disk['load_cycles'] * 20000,
+        'host_writes'              : disk['load_cycles'] * 15000,
+        'controller_busy_time'     : disk['power_on'] // 10,
+        'power_cycles'             : disk['power_on'] // 500,
+        'power_on_hours'           : disk['power_on'],
+        'unsafe_shutdowns'         : disk['power_on'] // 5000,
+        'media_errors'             : disk['reallocated'],
+        'num_err_log_entries'      : disk['reallocated'] * 3,
+        'warning_temp_time'        : 0,
+        'critical_comp_time'       : 0,
+    }
+
+def FAKE_SMART_JSON(disk, date, malformed=False):
+    document = {
+        'json_format_version': [1, 0],
+        'smartctl'           : {'version': [7, 2], 'exit_status': 0},
+        'serial_number'      : disk['Serial Number'],
+        'local_time'         : {'time_t': date, 'asctime': time.strftime('%a %b %e %H:%M:%S %Y UTC', time.gmtime(date))},
+        'smart_status'       : {'passed': True},
+    }
+
+    if disk['nvme']:
+        document['device'    ] = {'name': '/dev/nvme0', 'type': 'nvme', 'protocol': 'NVMe'}
+        document['model_name'] = 'Samsung SSD 970 EVO Plus 1TB'
+        document['nvme_smart_health_information_log'] = FAKE_NVME_HEALTH(disk)
+    else:
+        document['device'              ] = {'name': '/dev/sda', 'type': 'sat', 'protocol': 'ATA'}
+        document['model_family'        ] = EXAMPLE_INFO['Model Family']
+        document['model_name'          ] = EXAMPLE_INFO['Device Model']
+        document['in_smartctl_database'] = EXAMPLE_INFO['Device is'].startswith('In ')
+        document['ata_smart_attributes'] = {'revision': 16, 'table': [FAKE_ATTRIBUTE_JSON(disk, attribute_id)
+                                                                      for attribute_id in EXAMPLE_ATTRIBUTES['METRICS']]}
+
+    text = json.dumps(document, indent=2)
+
+    if malformed:
+        text = text[:len(text) // 3]
+
+    return text
+
+def generate_SMART_DIR(root, nb_disks, nb_samples, interval=1, start='2020-01-01',
+                       degrading=0.1, wide=0.2, malformed=0.0, seed=0, json_logs=0.0, nvme=0.0):
+    # json_logs: fraction of disks logged with smartctl -j, nvme: fraction of NVMe disks among them
+    rng = random.Random(seed)
+
+    first_date = sg.parse_DATE_ARGUMENT(start)
+
+    nb_logs = 0
+    for index in range(nb_disks):
+        disk = new_FAKE_DISK(index, rng, rng.random() < degrading, rng.random() < wide)
+
+        as_json      = rng.random() < json_logs
+        is_nvme      = rng.random() < nvme     # drawn anyway, for the same disks whatever json_logs
+        disk['nvme'] = as_json and is_nvme
+
+        directory = os.path.join(root, disk['Serial Number'])
+        os.makedirs(directory, exist_ok=True)
+
+        for sample in range(nb_samples):
+            drift_FAKE_DISK(disk, rng, interval)
+
+            date = first_date + sample * interval * 3600 + rng.randrange(60)
+
+            if as_json:
+                logname = os.path.join(directory, sg.format_date(date) + '.json')
+                content = FAKE_SMART_JSON(disk, date, rng.random() < malformed)
+            else:
+                logname = os.path.join(directory, sg.format_date(date) + '.txt')
+                content = FAKE_SMART_LOG (disk, date, rng.random() < malformed)
+
+            with open(logname, 'w') as fp:
+                fp.write(content)
+
+            nb_logs += 1
+
+    return nb_logs
+
+#======================================================================
+# Fake smartctl
+#
+# Stand-in for smartctl, e.g. for smart_collector.py --smartctl 'smart_bench.py smartctl':
+#
+#     smartctl --scan                                   /dev/fake0 ... /dev/fakeN-1
+#     smartctl [--json=o] -iAH --nocheck=standby DISK   a FAKE_SMART_LOG() of DISK
+#
+# Disks and their attributes (drifting with time) are the same from one call to
+# the next. FAKE_SMARTCTL_DISKS sets the number of disks (default 8), and
+# FAKE_SMARTCTL_DELAY the seconds a query takes (default 0), e.g. spinning up.
+
+FAKE_SMARTCTL_EPOCH = sg.parse_DATE_ARGUMENT('2020-01-01')
+
+def fake_smartctl(arguments):
+    nb_disks = int(os.environ.get('FAKE_SMARTCTL_DISKS', 8))
+
+    if '--scan' in arguments:
+        for index in range(nb_disks):
+            print(f'/dev/fake{index} -d sat # /dev/fake{index}, ATA device')
+        return 0
+
+    disk = arguments[-1] if arguments else ''
+    if not disk.startswith('/dev/fake') or not disk[9:].isdigit() or int(disk[9:]) >= nb_disks:
+        print(f'Smartctl open device: {disk} failed: No such device')
+        return 2
+
+    time.sleep(float(os.environ.get('FAKE_SMARTCTL_DELAY', 0)))
+
+    index = int(disk[9:])
+    rng   = random.Random(index)
+    date  = int(time.time())
+
+    fake_disk = new_FAKE_DISK(index, rng, index % 10 == 0, False)
+    fake_disk['nvme'] = False
+    drift_FAKE_DISK(fake_disk, rng, (date - FAKE_SMARTCTL_EPOCH) // 3600)
+
+    text = FAKE_SMART_LOG(fake_disk, date)
+
+    if any(argument.startswith(('-j', '--json')) for argument in arguments):
+        document = json.loads(FAKE_SMART_JSON(fake_disk, date))
+        document['smartctl']['output'] = text.splitlines()
+        text = json.dumps(document, indent=2)
+
+    print(text)
+    return 0
+
+#======================================================================
+# Benchmark suite
+
+def peak_RSS_MB():
+    # ru_maxrss is in kilobytes on Linux
+    self_rss     = resource.getrusage(resource.RUSAGE_SELF    ).ru_maxrss
+    children_rss = resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss
+    return self_rss / 1024, children_rss / 1024
+
+def timed(function, *args, **kwargs):
+    start = time.perf_counter()
+    result = function(*args, **kwargs)
+    return result, time.perf_counter() - start
+
+def warm_up(list_of_lognames):
+    # imports numpy (deferred by smart_graphic.py) and the parsing code paths
+    # before the first timed run, which would otherwise pay for them
+    sg.np.ma.masked
+    sg.load_SMART_INFOS(list_of_lognames[:1], None)
+
+def bench_ingestion(list_of_lognames, jobs):
+    warm_up(list_of_lognames)
+
+    cache_dir = tempfile.mkdtemp(prefix='smart_bench_')
+    try:
+        for label, nb_jobs in [('serial', 1), (f'{jobs} jobs', jobs)][:2 if jobs > 1 else 1]:
+            cache_name = os.path.join(cache_dir, f'samples_{nb_jobs}')
+
+            smart_infos, elapsed = timed(sg.load_SMART_INFOS, list_of_lognames, None, jobs=nb_jobs)
+            print(f'ingestion, {label:8}, no cache   : {len(list_of_lognames) / elapsed:10,.0f} logs/s ({elapsed:.2f} s)')
+
+            _, elapsed = timed(sg.load_SMART_INFOS, list_of_lognames, cache_name, jobs=nb_jobs)
+            print(f'ingestion, {label:8}, cold cache : {len(list_of_lognames) / elapsed:10,.0f} logs/s ({elapsed:.2f} s)')
+
+            _, elapsed = timed(sg.load_SMART_INFOS, list_of_lognames, cache_name, jobs=nb_jobs)
+            print(f'ingestion, {label:8}, warm cache : {len(list_of_lognames) / elapsed:10,.0f} logs/s ({elapsed:.2f} s)')
+    finally:
+        shutil.rmtree(cache_dir)
+
+    return smart_infos
+
+def bench_rendering(smart_infos, nb_renders, max_points=None):
+    sg.import_PYPLOT(sg.BATCH_BACKEND)
+
+    outdir = tempfile.mkdtemp(prefix='smart_bench_')
+    try:
+        disks = list(smart_infos)[:nb_renders]
+
+        _, elapsed = timed(lambda: [sg.render_SMART_DATA(smart_infos[disk_SN], disk_SN, outdir, max_points)
+                                    for disk_SN in disks])
+
+        png_size = sum(entry.stat().st_size for entry in os.scandir(outdir)) / max(len(disks), 1)
+    finally:
+        shutil.rmtree(outdir)
+
+    label = 'full resolution' if max_points is None else f'downsampled {max_points or "auto"}'
+    print(f'rendering, {label:21}: {elapsed / max(len(disks), 1):10.3f} s/figure ({png_size / 1024:.0f} KiB/figure)')
+
+def same_SMART_INFOS(smart_infos, other_infos):
+    if smart_infos.keys() != other_infos.keys():
+        return False
+
+    for disk_SN, smart_data in smart_infos.items():
+        other_data = other_infos[disk_SN]
+
+        if smart_data['attribute_ids'] != other_data['attribute_ids'] or \
+           not sg.np.array_equal(smart_data['date'], other_data['date']):
+            return False
+
+        for col_name in sg.METRICS:
+            if not sg.np.ma.allequal(smart_data[col_name], other_data[col_name]) or \
+               not sg.np.array_equal(sg.np.ma.getmaskarray(smart_data[col_name]), sg.np.ma.getmaskarray(other_data[col_name])):
+                return False
+
+        for col_name in ['ATTRIBUTE_NAME', 'FLAG', 'TYPE', 'WHEN_FAILED', 'Model Family', 'Device Model', 'Device is']:
+            if smart_data[col_name] != other_data[col_name]:
+                return False
+
+    return True
+
+def bench_formats(nb_disks, nb_samples, seed=0, nb_rounds=3):
+    # the same fake disks, logged as text then as JSON, parsed in alternate rounds
+    # after a warm-up, so that neither pays the imports, the best round being kept
+    root = tempfile.mkdtemp(prefix='smart_bench_')
+    try:
+        lognames = dict()
+        for label, json_logs in [('text', 0.0), ('json', 1.0)]:
+            generate_SMART_DIR(os.path.join(root, label), nb_disks, nb_samples, seed=seed, json_logs=json_logs)
+            lognames[label] = sg.list_SMART_LOGS(os.path.join(root, label))
+            warm_up(lognames[label])
+
+        results = dict()
+        best    = dict()
+        for _ in range(nb_rounds):
+            for label in lognames:
+                results[label], elapsed = timed(sg.load_SMART_INFOS, lognames[label], None)
+                best[label] = min(best.get(label, elapsed), elapsed)
+
+        for label, list_of_lognames in lognames.items():
+            size = sum(os.path.getsize(logname) for logname in list_of_lognames)
+            print(f'ingestion, {label}, no cache : {len(list_of_lognames) / best[label]:10,.0f} logs/s '
+                  f'(best of {nb_rounds}: {best[label]:.2f} s, {size / len(list_of_lognames) / 1024:.1f} KiB/log)')
+    finally:
+        shutil.rmtree(root)
+
+    print(f'same samples             : {same_SMART_INFOS(results["text"], results["json"])}')
+
+def same_SERIES(smart_infos, compacted_infos):
+    # compacted samples (first and last of each period, recent logs) are original ones,
+    # standing for as many logs
+    if smart_infos.keys() != compacted_infos.keys():
+        return False
+
+    for disk_SN, smart_data in smart_infos.items():
+        compacted_data = compacted_infos[disk_SN]
+
+        rows = sg.np.searchsorted(smart_data['date'], compacted_data['date'])
+        if smart_data['attribute_ids'] != compacted_data['attribute_ids'] or \
+           not sg.np.array_equal(smart_data['date'][rows], compacted_data['date']) or \
+           smart_data['samples'].sum() != compacted_data['samples'].sum():
+            return False
+
+        for col_name in sg.METRICS:
+            if not sg.np.ma.allequal(smart_data[col_name][rows], compacted_data[col_name]) or \
+               not sg.np.array_equal(sg.np.ma.getmaskarray(smart_data[col_name][rows]),
+                                     sg.np.ma.getmaskarray(compacted_data[col_name])):
+                return False
+
+    return True
+
+def bench_compact(nb_disks, nb_samples, seed=0):
+    # text, JSON and NVMe disks, all but the latest week of logs compacted by week
+    root = tempfile.mkdtemp(prefix='smart_bench_')
+    try:
+        generate_SMART_DIR(root, nb_disks, nb_samples, seed=seed, degrading=0.5, json_logs=0.5, nvme=0.5)
+
+        smart_infos = sg.load_SMART_INFOS(sg.list_SMART_LOGS(root), None)
+        summaries   = [sg.SMART_DATA_summary(smart_data, disk_SN) for disk_SN, smart_data in sorted(smart_infos.items())]
+
+        before       = max(int(smart_data['date'][-1]) for smart_data in smart_infos.values()) - 7*24*3600
+        directories  = sorted(entry.path for entry in os.scandir(root) if entry.is_dir())
+        nb_files     = len(sg.list_SMART_LOGS(root))
+        _, elapsed   = timed(sg.compact_SMART_DIRS, directories, before)
+        nb_remaining = len(sg.list_SMART_LOGS(root))
+        print(f'compaction               : {nb_files:,} files -> {nb_remaining:,} ({elapsed:.2f} s)')
+
+        compacted_infos     = sg.load_SMART_INFOS(sg.list_SMART_LOGS(root), None)
+        compacted_summaries = [sg.SMART_DATA_summary(smart_data, disk_SN)
+                               for disk_SN, smart_data in sorted(compacted_infos.items())]
+    finally:
+        shutil.rmtree(root)
+
+    same_series    = same_SERIES(smart_infos, compacted_infos)
+    same_summaries = json.dumps(summaries) == json.dumps(compacted_summaries)
+    print(f'same samples             : {same_series}')
+    print(f'same summaries           : {same_summaries}')
+
+    return 0 if same_series and same_summaries and nb_remaining < nb_files else 1
+
+def fetch(url):
+    with urllib.request.urlopen(url) as response:
+        return response.read()
+
+def bench_serve(nb_disks, nb_samples, nb_scrapes):
+    # a --serve index of a generated tree, scraped by a local client, then updated with a new log
+    root = tempfile.mkdtemp(prefix='smart_bench_')
+    try:
+        generate_SMART_DIR(os.path.join(root, 'smart'), nb_disks, nb_samples)
+        # same disk 0, one more log
+        generate_SMART_DIR(os.path.join(root, 'next'), 1, nb_samples + 1)
+
+        smart_dir = os.path.join(root, 'smart')
+        time.sleep(sg.LOG_SETTLE_TIME)     # generated logs are then not new ones
+
+        watch       = sg.new_LOG_WATCH(smart_dir)
+        smart_infos = sg.load_SMART_INFOS(sg.list_SMART_LOGS(smart_dir))
+
+        index, elapsed = timed(sg.new_SMART_INDEX, smart_infos)
+        print(f'serve, index              : {elapsed * 1000:10.1f} ms ({nb_disks} disks)')
+
+        server = sg.start_SMART_SERVER(index)
+        try:
+            url = f'http://{sg.SERVE_ADDRESS}:{server.server_port}'
+
+            for path in ['/metrics', '/json']:
+                body, elapsed = timed(lambda: [fetch(url + path) for _ in range(nb_scrapes)])
+                print(f'serve, {path:19}: {elapsed / nb_scrapes * 1e6:10.0f} us/request ({len(body[0]) / 1024:.0f} KiB)')
+
+            disk_SN = sorted(smart_infos)[0]
+            before  = json.loads(fetch(f'{url}/json/{disk_SN}'))
+
+            next_dir = os.path.join(root, 'next', disk_SN)
+            shutil.copy(os.path.join(next_dir, max(os.listdir(next_dir))), os.path.join(smart_dir, disk_SN))
+            os.utime(smart_dir, None)
+            time.sleep(sg.LOG_SETTLE_TIME)
+
+            new_lognames = sg.poll_LOG_WATCH(watch)
+            _, elapsed   = timed(sg.update_SMART_INDEX, index, smart_infos, sg.parse_SMART_LOGS(new_lognames))
+            after        = json.loads(fetch(f'{url}/json/{disk_SN}'))
+
+            print(f'serve, update             : {elapsed * 1000:10.1f} ms ({len(new_lognames)} new log, '
+                  f'{before["samples"]} -> {after["samples"]} samples, latest {after["latest"]})')
+        finally:
+            server.shutdown()
+    finally:
+        shutil.rmtree(root)
+
+def bench_SMART_DIR(root, jobs, nb_renders):
+    list_of_lognames = sg.list_SMART_LOGS(root)
+
+    print(f'{root}: {len(list_of_lognames)} logs, {len(os.listdir(root))} disks')
+
+    smart_infos = bench_ingestion(list_of_lognames, jobs)
+
+    if nb_renders > 0:
+        bench_rendering(smart_infos, nb_renders)
+        bench_rendering(smart_infos, nb_renders, max_points=0)
+
+    self_rss, children_rss = peak_RSS_MB()
+    print(f'peak RSS                         : {self_rss:10.0f} MiB (workers: {children_rss:.0f} MiB)')
+
+def main():
+    # smartctl options are not ours, argparse would reject them
+    if sys.argv[1:2] == ['smartctl']:
+        return fake_smartctl(sys.argv[2:])
+
+    parser = argparse.ArgumentParser(description='benchmarks for smart_graphic.py')
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    parser_parser = subparsers.add_parser('parser', help='micro-benchmark of the attribute table parser')
+    parser_parser.add_argument('--rows', type=int, default=200000, metavar='N',
+                               help='number of attribute rows to be parsed (default: %(default)s)')
+
+    parser_generate = subparsers.add_parser('generate', help='generate a fake /var/log/smart tree')
+    parser_generate.add_argument('root', metavar='DIR')
+    parser_generate.add_argument('--disks', type=int, default=10, metavar='N',
+                                 help='number of disks (default: %(default)s)')
+    parser_generate.add_argument('--samples', type=int, default=1000, metavar='M',
+                                 help='number of logs per disk (default: %(default)s)')
+    parser_generate.add_argument('--interval', type=int, default=1, metavar='HOURS',
+                                 help='hours between two logs (default: %(default)s)')
+    parser_generate.add_argument('--start', default='2020-01-01', metavar='DATE',
+                                 help='date of the first logs, YYYY-MM-DD (default: %(default)s)')
+    parser_generate.add_argument('--degrading', type=float, default=0.1, metavar='FRACTION',
+                                 help='fraction of degrading disks (default: %(default)s)')
+    parser_generate.add_argument('--wide', type=float, default=0.2, metavar='FRACTION',
+                                 help='fraction of disks with wider columns (default: %(default)s)')
+    parser_generate.add_argument('--malformed', type=float, default=0.0, metavar='FRACTION',
+                                 help='fraction of truncated logs (default: %(default)s)')
+    parser_generate.add_argument('--json', type=float, default=0.0, metavar='FRACTION', dest='json_logs',
+                                 help='fraction of disks logged as smartctl -j JSON (default: %(default)s)')
+    parser_generate.add_argument('--nvme', type=float, default=0.0, metavar='FRACTION',
+                                 help='fraction of NVMe disks among JSON logged ones (default: %(default)s)')
+    parser_generate.add_argument('--seed', type=int, default=0)
+
+    parser_run = subparsers.add_parser('run', help='benchmark ingestion and rendering of a log tree')
+    parser_run.add_argument('root', metavar='DIR')
+    parser_run.add_argument('-j', '--jobs', type=int, default=os.cpu_count(), metavar='N',
+                            help='number of worker processes for parallel ingestion (default: %(default)s)')
+    parser_run.add_argument('--renders', type=int, default=3, metavar='K',
+                            help='number of figures to be rendered (default: %(default)s)')
+
+    parser_smartctl = subparsers.add_parser('smartctl', help='fake smartctl, e.g. for smart_collector.py')
+    parser_smartctl.add_argument('arguments', nargs=argparse.REMAINDER)
+
+    parser_formats = subparsers.add_parser('formats', help='compare ingestion of text and JSON logs')
+    parser_formats.add_argument('--disks', type=int, default=10, metavar='N',
+                                help='number of disks (default: %(default)s)')
+    parser_formats.add_argument('--samples', type=int, default=500, metavar='M',
+                                help='number of logs per disk (default: %(default)s)')
+
+    parser_compact = subparsers.add_parser('compact', help='round trip of --compact on a generated tree')
+    parser_compact.add_argument('--disks', type=int, default=6, metavar='N',
+                                help='number of disks (default: %(default)s)')
+    parser_compact.add_argument('--samples', type=int, default=1000, metavar='M',
+                                help='number of logs per disk (default: %(default)s)')
+
+    parser_serve = subparsers.add_parser('serve', help='scrape a --serve index of a generated tree')
+    parser_serve.add_argument('--disks', type=int, default=20, metavar='N',
+                              help='number of disks (default: %(default)s)')
+    parser_serve.add_argument('--samples', type=int, default=200, metavar='M',
+                              help='number of logs per disk (default: %(default)s)')
+    parser_serve.add_argument('--scrapes', type=int, default=200, metavar='K',
+                              help='number of requests per endpoint (default: %(default)s)')
+
+    args = parser.parse_args()
+
+    if args.command == 'parser':
+        bench_parser(args.rows)
+
+    elif args.command == 'generate':
+        nb_logs, elapsed = timed(generate_SMART_DIR, args.root, args.disks, args.samples, args.interval, args.start,
+                                 args.degrading, args.wide, args.malformed, args.seed, args.json_logs, args.nvme)
+        print(f'{args.root}: {nb_logs} logs generated in {elapsed:.1f} s')
+
+    elif args.command == 'run':
+        bench_SMART_DIR(args.root, args.jobs, args.renders)
+
+    elif args.command == 'formats':
+        bench_formats(args.disks, args.samples)
+
+    elif args.command == 'compact':
+        return bench_compact(args.disks, args.samples)
+
+    elif args.command == 'serve':
+        bench_serve(args.disks, args.samples, args.scrapes)
+
+if __name__ == '__main__':
+    sys.exit(main())
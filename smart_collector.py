@@ -0,0 +1,297 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+""" collects S.M.A.R.T. data of all disks, concurrently, for smart_graphic.py
+
+Python counterpart of the smart_logger loop: smartctl is run once per disk, by a
+bounded pool of worker threads, so that a JBOD full of disks is queried in about
+the time of its slowest disks rather than in the sum of all of them.
+
+    # -i            --info            # Prints some useful information
+    # -A            --attributes      # Prints only the vendor specific SMART Attributes
+    # -H            --health          # Prints the health status of the device
+    # -n standby    --nocheck=standby # check the device unless it is in SLEEP or STANDBY mode
+    #
+    smartctl -iAH --nocheck=standby /dev/sda
+
+Each output is parsed in memory (the serial number names the directory of the log)
+then written once, as /var/log/smart/<disk_Serial_Number>/YYYY-MM-DD_HHMM.txt (or
+.json with --format json). Samples can also be added to the parsed-sample cache of
+smart_graphic.py (--cache), which then does not need to parse them again.
+
+The synthesis (Pre-fail, Old_age and critical attributes of each disk, and changes
+since its oldest log) is built from the parsed samples, it is written to
+/var/log/smart/YYYY-MM-DD_HHMM_synthesis.txt, or to stdout from a terminal.
+
+Example:
+
+    smart_collector.py                          # all disks of smartctl --scan
+    smart_collector.py --jobs 16 /dev/sda /dev/sdb
+
+    # against a fake smartctl, see smart_bench.py
+    smart_collector.py --smartctl 'smart_bench.py smartctl' --log-dir /tmp/smart
+
+This program is free software: you can redistribute it and/or modify it under
+the terms of the GNU General Public License as published by the Free Software
+Foundation, either version 3 of the License, or (at your option) any later
+version.
+
+This program is distributed in the hope that it will be useful, but WITHOUT
+ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS
+FOR A PARTICULAR PURPOSE. See the GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License along with
+this program. If not, see <http://www.gnu.org/licenses/>.
+"""
+
+__author__     = "Daniel Exbrayat"
+__copyright__  = "Copyright 2023, personal"
+__date__       = "2023/08/02"
+__email__      = "daniel.exbrayat@laposte.net"
+__license__    = "GPLv3"
+__status__     = "Prototype"    # ['Prototype', 'Development', 'Production']
+__version__    = "0.1.0"
+
+import io
+import os
+import sys
+import time
+import shlex
+import argparse
+import subprocess
+from concurrent.futures import ThreadPoolExecutor
+
+import smart_graphic as sg
+
+#======================================================================
+# Querying disks
+#
+# smartctl exit status is a bit mask: bits 0 and 1 mean that there is no data at
+# all (command line error, device could not be opened or is in standby), the other
+# bits report the health of the disk, whose output is then logged as usual.
+
+SMARTCTL         = 'smartctl'
+SMARTCTL_OPTIONS = {'txt' : ['-iAH', '--nocheck=standby'],
+                    'json': ['--json=o', '-iAH', '--nocheck=standby']}   # o: text output included
+SMARTCTL_NO_DATA = 0b011
+
+MAX_JOBS = 16    # simultaneous smartctl
+
+def scan_DISKS(smartctl):
+    # smartctl --scan:  /dev/sda -d scsi # /dev/sda, SCSI device
+    output = subprocess.run(smartctl + ['--scan'], capture_output=True, text=True, check=True).stdout
+    return [line.split()[0] for line in output.splitlines() if line.strip() and not line.startswith('#')]
+
+def select_DISKS(scanned_disks, requested_disks):
+    # requested disks that have been scanned, once each, or all scanned disks by default
+    disks = []
+    for disk in requested_disks:
+        if disk in scanned_disks and disk not in disks:
+            disks.append(disk)
+
+    return disks or scanned_disks
+
+def collect_DISK(smartctl, disk, log_dir, date_hm, log_format='txt'):
+    # runs smartctl once, then writes its output under log_dir/<Serial Number>/
+    result = {'disk': disk, 'logname': None, 'sample': None, 'error': None}
+
+    process = subprocess.run(smartctl + SMARTCTL_OPTIONS[log_format] + [disk], capture_output=True, text=True)
+
+    if process.returncode & SMARTCTL_NO_DATA:
+        result['error'] = process.stdout + process.stderr
+        return result
+
+    try:
+        sample = sg.parse_SMART_LOG(disk, fp=io.StringIO(process.stdout))
+    except Exception as e:  # ill formatted, e.g. truncated, output
+        result['error'] = f'{disk}: unexpected smartctl output ({e!r})\n' + process.stdout
+        return result
+
+    directory = os.path.join(log_dir, sample['Serial Number'])
+    os.makedirs(directory, exist_ok=True)
+
+    logname = os.path.join(directory, f'{date_hm}.{log_format}')
+    with open(logname, 'w') as fp:
+        fp.write(process.stdout)
+
+    result['logname'] = logname
+    result['sample' ] = sample
+
+    return result
+
+def collect_DISKS(smartctl, disks, log_dir, date_hm, log_format='txt', jobs=MAX_JOBS):
+    # results in the order of disks
+    with ThreadPoolExecutor(max_workers=max(1, min(jobs, len(disks)))) as executor:
+        futures = [executor.submit(collect_DISK, smartctl, disk, log_dir, date_hm, log_format) for disk in disks]
+
+        return [future.result() for future in futures]
+
+#======================================================================
+# Parsed-sample cache
+#
+# New samples are added to the cache of smart_graphic.py, keyed as if
+# load_SMART_INFOS() had parsed the logs itself. Only the cache files (shards) of
+# the directories of the disks that have been collected are read and rewritten,
+# each atomically, so that a concurrent smart_graphic.py never reads a partial one.
+
+def cache_SAMPLES(cache_name, results):
+    results     = [result for result in results if result['sample'] is not None]
+    directories = {os.path.dirname(os.path.abspath(result['logname'])) for result in results}
+
+    entries = sg.load_SAMPLE_CACHE(cache_name, directories)
+
+    for result in results:
+        path = os.path.abspath(result['logname'])
+        stat = os.stat(path)
+        entries[path] = ((stat.st_size, stat.st_mtime_ns, False), [result['sample']], None)
+
+    sg.save_SAMPLE_CACHE(cache_name, entries, directories)
+
+    return entries
+
+def oldest_SAMPLE(directory, entries=None):
+    # (logname, sample) of the oldest log of a disk, from the cache when possible, not
+    # from an aggregate of smart_graphic.py --compact (its first sample is not a log)
+    lognames = sorted(entry.path for entry in os.scandir(directory) if entry.name.endswith(sg.LOG_FILE_EXTENSIONS)
+                      and sg.AGGREGATE_period(entry.name) is None)
+    if not lognames:
+        return None, None
+
+    logname = lognames[0]
+
+    entry = (entries or dict()).get(os.path.abspath(logname))
+    if entry is not None and entry[1]:
+        return logname, entry[1][0]
+
+    samples, error = sg.try_SMART_FILE(logname)
+
+    return logname, samples[0] if samples else None
+
+#======================================================================
+# Synthesis
+#
+# Same sections as the synthesis of smart_logger, rebuilt from the samples.
+
+# the following attributes are ranked as critical by
+#    https://en.wikipedia.org/wiki/Self-Monitoring,_Analysis_and_Reporting_Technology
+CRITICAL_ID = ['1', '2', '5', '10', '184', '187', '188', '196', '197', '198', '201']
+
+SEP_LINE1 = '#' * 98
+SEP_LINE2 = '-' * 98
+
+HEADER = 'ID# ATTRIBUTE_NAME          FLAG     VALUE WORST THRESH TYPE      WHEN_FAILED RAW_VALUE'
+
+def format_METRIC(value):
+    return '-' if value == sg.MISSING else str(value)
+
+def format_ATTRIBUTE(sample, attribute_id):
+    value, worst, thresh, raw_value = [format_METRIC(metric) for metric in sample['METRICS'][attribute_id][:4]]
+
+    return f'{attribute_id:>3} {sample["ATTRIBUTE_NAME"][attribute_id]:<23} {sample["FLAG"][attribute_id]:<8} ' \
+           f'{value:>5} {worst:>5} {thresh:>6} {sample["TYPE"][attribute_id]:<9} ' \
+           f'{sample["WHEN_FAILED"][attribute_id]:^11} {raw_value}'
+
+def DISK_SYNTHESIS(result, oldest_logname=None, oldest_sample=None):
+    lines = [result['disk'], '']
+
+    if result['sample'] is None:
+        return lines + ['    ERROR: ' + line for line in result['error'].splitlines()]
+
+    sample = result['sample']
+
+    lines += [f'Model Family:     {sample["Model Family"]}',
+              f'Device Model:     {sample["Device Model"]}',
+              f'Serial Number:    {sample["Serial Number"]}',
+              '',
+              result['logname'],
+              '']
+
+    for title, attribute_ids in [
+        ('Pre-fail attributes', [attribute_id for attribute_id in sample['METRICS'] if sample['TYPE'][attribute_id] == 'Pre-fail']),
+        ('Old_age attributes' , [attribute_id for attribute_id in sample['METRICS'] if sample['TYPE'][attribute_id] != 'Pre-fail']),
+        ('Critical attributes', [attribute_id for attribute_id in CRITICAL_ID if attribute_id in sample['METRICS']]),
+    ]:
+        lines += [f'######### {title}', HEADER]
+        lines += [format_ATTRIBUTE(sample, attribute_id) for attribute_id in attribute_ids]
+        lines += ['']
+
+    if oldest_sample is None or oldest_logname == result['logname']:
+        return lines
+
+    lines += [SEP_LINE2, f'changes since {oldest_logname}', '',
+              f'ID# {"ATTRIBUTE_NAME":<23} {"VALUE":>11} {"WORST":>11} {"RAW_VALUE":>27}']
+
+    for attribute_id, metrics in sample['METRICS'].items():
+        old_metrics = oldest_sample['METRICS'].get(attribute_id)
+        if old_metrics is None or old_metrics[:4] == metrics[:4]:
+            continue
+
+        value, worst, raw_value = [f'{format_METRIC(old_metrics[k])} -> {format_METRIC(metrics[k])}'
+                                   for k in [0, 1, 3]]  # VALUE, WORST, RAW_VALUE
+        lines += [f'{attribute_id:>3} {sample["ATTRIBUTE_NAME"][attribute_id]:<23} {value:>11} {worst:>11} {raw_value:>27}']
+
+    return lines + ['']
+
+def SYNTHESIS(results, log_dir, date_hm, entries=None):
+    lines = [f'{date_hm} UTC', '',
+             'Helpful information about SMART can be found in:',
+             '    https://www.linuxjournal.com/article/6983']
+
+    for result in results:
+        oldest_logname, oldest_sample = None, None
+        if result['sample'] is not None:
+            oldest_logname, oldest_sample = oldest_SAMPLE(os.path.dirname(result['logname']), entries)
+
+        lines += [f'{SEP_LINE1}   {SEP_LINE1}']
+        lines += DISK_SYNTHESIS(result, oldest_logname, oldest_sample)
+
+    return '\n'.join(lines) + '\n'
+
+#======================================================================
+def main():
+    parser = argparse.ArgumentParser(description='collects SMART data of all disks, concurrently')
+    parser.add_argument('disks', nargs='*', metavar='DISK',
+                        help='disks to be queried, among those of smartctl --scan (default: all of them)')
+    parser.add_argument('--smartctl', default=SMARTCTL, metavar='COMMAND',
+                        help='smartctl command, e.g. a fake one for testing (default: %(default)s)')
+    parser.add_argument('--log-dir', default=None, metavar='DIR',
+                        help=f'where logs are written (default: {sg.SMART_DIR}, /tmp from a terminal)')
+    parser.add_argument('--format', default=os.environ.get('SMART_LOG_FORMAT', 'txt'), choices=['txt', 'json'],
+                        help='smartctl text or JSON logs (default: $SMART_LOG_FORMAT or txt)')
+    parser.add_argument('-j', '--jobs', type=int, default=MAX_JOBS, metavar='N',
+                        help='maximum number of simultaneous smartctl (default: %(default)s)')
+    parser.add_argument('--cache', nargs='?', const=sg.SAMPLE_CACHE, default=None, metavar='DIR',
+                        help=f'also add the samples to the parsed-sample cache of smart_graphic.py '
+                             f'(default DIR: {sg.SAMPLE_CACHE})')
+    args = parser.parse_args()
+
+    interactive = sys.stdout.isatty()
+
+    log_dir = args.log_dir or ('/tmp' if interactive else sg.SMART_DIR)
+    date_hm = time.strftime('%Y-%m-%d_%H%M', time.gmtime())
+
+    smartctl = shlex.split(args.smartctl)
+
+    disks   = select_DISKS(scan_DISKS(smartctl), args.disks)
+    results = collect_DISKS(smartctl, disks, log_dir, date_hm, args.format, args.jobs)
+
+    # so that root receives an email from cron
+    for result in results:
+        if result['error'] is not None:
+            print(result['error'], file=sys.stderr)
+
+    entries = None
+    if args.cache is not None:
+        entries = cache_SAMPLES(args.cache, results)
+
+    synthesis = SYNTHESIS(results, log_dir, date_hm, entries)
+
+    if interactive:
+        sys.stdout.write(synthesis)
+    else:
+        with open(os.path.join(log_dir, f'{date_hm}_synthesis.txt'), 'w') as fp:
+            fp.write(synthesis)
+
+    return 1 if any(result['error'] is not None for result in results) else 0
+
+if __name__ == '__main__':
+    sys.exit(main())
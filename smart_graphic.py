@@ -52,18 +52,79 @@ __license__    = "GPLv3"
 __status__     = "Prototype"    # ['Prototype', 'Development', 'Production']
 __version__    = "0.1.0"
 
+import os
 import sys
-# import re
+import re
 import math
+import time
+import calendar
+import pickle
+import io
+import argparse
+import resource
+import tracemalloc
 import random
-import numpy as np
-from datetime import datetime
+import importlib.util
+import types
+from operator import itemgetter
+from functools import partial
+from contextlib import contextmanager, nullcontext
+from datetime import timedelta
+from urllib.parse import quote, unquote
+from concurrent.futures import ProcessPoolExecutor
 # import subprocess
-# import json
-import matplotlib.pyplot as plt
-import matplotlib as mpl
+import json
 
-# plt.rcParams['toolbar'] = 'None' # Remove tool bar (upper)
+#======================================================================
+# Deferred imports
+#
+# Importing matplotlib.pyplot takes more than half a second, numpy about a tenth,
+# before anything is parsed. numpy is only loaded on first use (LazyLoader), and
+# matplotlib by import_PYPLOT() when a figure is actually built, so that parsing
+# and text/JSON summaries (e.g. from cron or Nagios checks) start quickly. Should
+# numpy not be installed, the error is deferred to its first use as well, so that
+# what does not need it (e.g. smart_collector.py) still runs.
+
+def missing_MODULE(name):
+    # stands for a module that is not installed, raising on first use only
+    module = types.ModuleType(name)
+
+    def __getattr__(attribute):
+        raise ModuleNotFoundError(f"No module named '{name}', needed for {name}.{attribute}", name=name)
+
+    module.__getattr__ = __getattr__
+
+    return module
+
+def lazy_import(name):
+    if name in sys.modules:
+        return sys.modules[name]
+
+    spec = importlib.util.find_spec(name)
+    if spec is None:
+        return missing_MODULE(name)
+
+    spec.loader = importlib.util.LazyLoader(spec.loader)
+    module      = importlib.util.module_from_spec(spec)
+
+    sys.modules[name] = module
+    spec.loader.exec_module(module)
+
+    return module
+
+np  = lazy_import('numpy')
+plt = None      # matplotlib.pyplot, see import_PYPLOT()
+mpl = None      # matplotlib
+
+def import_PYPLOT(backend=None):
+    global plt, mpl
+
+    import matplotlib as mpl
+    if backend is not None:
+        mpl.use(backend)
+    import matplotlib.pyplot as plt
+
+    # plt.rcParams['toolbar'] = 'None' # Remove tool bar (upper)
 
 SMART_DATA_EXAMPLE = \
 '''
@@ -113,36 +174,69 @@ Example of SMART DATA generated by command: # smartctl -iAH /dev/sda
 # 199 UDMA_CRC_Error_Count    0x0032   200   200   000    Old_age   Always       -       0
 # 200 Multi_Zone_Error_Rate   0x0008   200   200   000    Old_age   Offline      -       0
 '''
-PATTERN_for_SLICING_SMART_DATA = \
- 'xxx xxxxxxxxxxxxxxxxxxxxxxx xxxxxx   xxx   xxx   xxx    xxxxxxxxx xxxxxxxx xxxxxxxxxxx xxxxxxxxxxxxxx '
-#           1         2         3         4         5         6         7         8         9
-# 012345678901234567890123456789012345678901234567890123456789012345678901234567890123456789012345678901
 
-def SMART_DATA_Slices(string):
-    i = j = 0
-    while i < len(string):
-        while string[i] == ' ':
-            i += 1
-        j = i+1
-        while string[j] != ' ':
-            j += 1
-        yield i,j
-        i = j+1
+# Columns of the attribute table are found from the actual 'ID# ...' header line
+# rather than from fixed offsets: ATTRIBUTE_NAME or RAW_VALUE may be wider than in
+# SMART_DATA_EXAMPLE, and 'smartctl -f brief' prints fewer columns:
+#
+#     ID# ATTRIBUTE_NAME          FLAGS    VALUE WORST THRESH FAIL RAW_VALUE
+#       1 Raw_Read_Error_Rate     POSR-K   200   200   051    -    0
+#
+# Every column but RAW_VALUE (always the last one) is a single word, so a row is
+# split at once into as many fields as there are headers.
+SMART_DATA_COLUMN_ALIASES = {'FLAGS': 'FLAG', 'FAIL': 'WHEN_FAILED'}
 
-SMART_DATA_SLICES = [ij for ij in SMART_DATA_Slices(PATTERN_for_SLICING_SMART_DATA)]
+def SMART_DATA_Columns(header_line):
+    headers = header_line.split()
 
-SMART_DATA_HEADERS_str = [h for h in SMART_DATA_EXAMPLE.splitlines() if 'ID# ' in h][0][2:]
-# print('"'+SMART_DATA_HEADERS_str+"'")
+    columns = {SMART_DATA_COLUMN_ALIASES.get(col_name, col_name): index
+               for index, col_name in enumerate(headers)}
 
-SMART_DATA_HEADERS = SMART_DATA_HEADERS_str.split()
-# print(SMART_DATA_HEADERS)
+    if columns.get('RAW_VALUE') != len(headers) - 1:
+        raise ValueError(f'unexpected attribute table header: {header_line.strip()}')
 
-def SMART_DATA_Headers_and_Values(line):
-    for col_name,ij in zip(SMART_DATA_HEADERS, SMART_DATA_SLICES):
-        i,j = ij
-        value = line[i:j]
+    return columns
 
-        yield col_name, value.split()[0]
+# Missing or non numerical cells (e.g. '---') are stored as MISSING, then masked
+MISSING = -2**63
+
+def to_int(string):
+    try:
+        return int(string)
+    except ValueError:
+        return MISSING
+
+# RAW_VALUE comes in several flavours:
+#
+#     22000
+#     24 (Min/Max 21/27)
+#     24 (0 17 0 0 0)
+#     12345h+23m+45.678s
+#     0x000000000000
+#
+# parse_RAW_VALUE() returns (RAW_VALUE, RAW_MIN, RAW_MAX)
+RAW_VALUE_LEADING_INT = re.compile(r'(\d+)')
+RAW_VALUE_MIN_MAX     = re.compile(r'Min/Max (\d+)/(\d+)')
+
+def parse_RAW_VALUE(raw_value):
+    if raw_value.isdigit():
+        return int(raw_value), MISSING, MISSING
+
+    if raw_value.startswith('0x'):
+        try:
+            return int(raw_value.split()[0], 16), MISSING, MISSING
+        except ValueError:
+            return MISSING, MISSING, MISSING
+
+    match = RAW_VALUE_LEADING_INT.match(raw_value)
+    if match is None:
+        return MISSING, MISSING, MISSING
+
+    min_max = RAW_VALUE_MIN_MAX.search(raw_value)
+    if min_max is None:
+        return int(match.group(1)), MISSING, MISSING
+
+    return int(match.group(1)), int(min_max.group(1)), int(min_max.group(2))
 
 #======================================================================
 def create_dict(existing_dict, key):
@@ -164,19 +258,249 @@ def create_set(existing_dict, key):
         existing_dict[key] = set()
     
 def seek_for_pattern(fp, pattern):
-    try:
-        while pattern not in next(fp):
-            pass
+    # returns the line that contains pattern, ValueError for ill formatted (e.g. truncated) logs
+    for line in fp:
+        if pattern in line:
+            return line
+
+    raise ValueError(f'pattern not found: {pattern}')
 
-    except StopIteration:
-        print('    ERROR: pattern not found: ', pattern)
-        print('    ERROR: file is ill formatted')
-        fp.close()
-        sys.exit()
+#======================================================================
+# Instrumentation
+#
+# With --profile, wall time and number of calls are recorded per stage and per disk,
+# with --profile-memory peak allocated memory (tracemalloc) as well:
+#
+#     glob, stat, cache-load, parse-info, parse-attributes, parse-json, cache-save,
+#     build-arrays, fleet, trends, digest, axis, render, save
+#
+# Stages run by worker processes are sent back to the parent with their results.
+# When disabled, profile_stage() returns a shared no-op context manager. tracemalloc
+# slows down allocation-heavy stages (render, save) noticeably, hence is opt-in: the
+# peak RSS (getrusage) is reported either way, at no cost.
+
+PROFILE = None      # {'records': {(stage, disk_SN): [calls, seconds, peak bytes]}, 'stack': [...],
+                    #  'trace_memory': bool}
+
+PROFILE_STAGES = ['glob', 'stat', 'cache-load', 'parse-info', 'parse-attributes', 'parse-json', 'cache-save',
+                  'build-arrays', 'fleet', 'trends', 'digest', 'axis', 'render', 'save']
+
+NO_PROFILE = nullcontext()
+
+def enable_PROFILE(trace_memory=False):
+    global PROFILE
+
+    PROFILE = {'records': dict(), 'stack': [], 'trace_memory': trace_memory}
+    if trace_memory:
+        tracemalloc.start()
+
+@contextmanager
+def profiled_stage(stage, disk_SN):
+    # peak memory allocated by a stage, above what was allocated when entering it
+    # (nested stages included, the peak counter being shared)
+    if not PROFILE['trace_memory']:
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            record = PROFILE['records'].setdefault((stage, disk_SN), [0, 0.0, 0])
+            record[0] += 1
+            record[1] += time.perf_counter() - start
+        return
+
+    stack = PROFILE['stack']
+    if stack:
+        stack[-1][1] = max(stack[-1][1], tracemalloc.get_traced_memory()[1])
+    tracemalloc.reset_peak()
+    stack.append([tracemalloc.get_traced_memory()[0], 0])
+
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        elapsed             = time.perf_counter() - start
+        traced, stack_peak  = stack.pop()
+        peak                = max(stack_peak, tracemalloc.get_traced_memory()[1]) - traced
+
+        record = PROFILE['records'].setdefault((stage, disk_SN), [0, 0.0, 0])
+        record[0] += 1
+        record[1] += elapsed
+        record[2]  = max(record[2], peak)
+
+def profile_stage(stage, disk_SN=''):
+    if PROFILE is None:
+        return NO_PROFILE
+
+    return profiled_stage(stage, disk_SN)
+
+def merge_PROFILE(records):
+    for key, (calls, seconds, peak) in records.items():
+        record = PROFILE['records'].setdefault(key, [0, 0.0, 0])
+        record[0] += calls
+        record[1] += seconds
+        record[2]  = max(record[2], peak)
+
+def profiled_task(trace_memory, function, *args, **kwargs):
+    # runs function in a worker process, returns its result and the records of its stages
+    enable_PROFILE(trace_memory)
+
+    return function(*args, **kwargs), PROFILE['records']
+
+def worker_task(function):
+    # function to be submitted to a worker process, see worker_result()
+    return function if PROFILE is None else partial(profiled_task, PROFILE['trace_memory'], function)
+
+def worker_result(result):
+    if PROFILE is None:
+        return result
+
+    result, records = result
+    merge_PROFILE(records)
+
+    return result
+
+def PROFILE_summary():
+    # peak_MiB per stage only when memory is traced
+    summary      = {'total': dict(), 'disks': dict()}
+    trace_memory = PROFILE['trace_memory']
+
+    for (stage, disk_SN), (calls, seconds, peak) in PROFILE['records'].items():
+        total = summary['total'].setdefault(stage, {'calls': 0, 'seconds': 0.0})
+        total['calls'   ] += calls
+        total['seconds' ] += seconds
+        if trace_memory:
+            total['peak_MiB'] = max(total.get('peak_MiB', 0.0), peak / 2**20)
+
+        if disk_SN:
+            disk = summary['disks'].setdefault(disk_SN, dict())
+            disk[stage] = {'calls': calls, 'seconds': seconds}
+            if trace_memory:
+                disk[stage]['peak_MiB'] = peak / 2**20
+
+    summary['peak_RSS_MiB'] = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+    return summary
+
+def print_PROFILE(json_name=None):
+    # to stderr, stdout being possibly --json
+    summary = PROFILE_summary()
+    peak    = f' {"peak MiB":>10}' if PROFILE['trace_memory'] else ''
+
+    def print_stages(title, stages):
+        print(f'{title:24} {"calls":>9} {"total s":>10} {"mean ms":>10}{peak}', file=sys.stderr)
+        for stage in PROFILE_STAGES:
+            if stage in stages:
+                calls, seconds = stages[stage]['calls'], stages[stage]['seconds']
+                peak_MiB       = f' {stages[stage]["peak_MiB"]:10.1f}' if peak else ''
+                print(f'    {stage:20} {calls:9} {seconds:10.3f} {1000 * seconds / calls:10.3f}{peak_MiB}',
+                      file=sys.stderr)
+        print(file=sys.stderr)
+
+    print(file=sys.stderr)
+    for disk_SN in sorted(summary['disks']):
+        print_stages(disk_SN, summary['disks'][disk_SN])
+
+    print_stages('TOTAL', summary['total'])
+    print(f'peak RSS: {summary["peak_RSS_MiB"]:.0f} MiB', file=sys.stderr)
+
+    if json_name is not None:
+        with open(json_name, 'w') as fp:
+            json.dump(summary, fp, indent=4)
 
 DATE_FORMAT = '%Y-%m-%d_%H%M'
 
-def parse_START_OF_INFORMATION_SECTION(fp, smart_infos):
+def format_date(epoch):
+    return time.strftime(DATE_FORMAT, time.gmtime(epoch))
+
+def days_before(dates, latest_date):
+    # dates and latest_date are epochs, dates may be a NumPy array
+    return (dates - latest_date) / (24*3600)
+
+# smartctl prints "Local Time is" with asctime(), i.e. with English names whatever
+# the locale is, followed by the abbreviation of the time zone.
+MONTHS = {month: number for number, month in enumerate(
+    ['Jan', 'Feb', 'Mar', 'Apr', 'May', 'Jun', 'Jul', 'Aug', 'Sep', 'Oct', 'Nov', 'Dec'], start=1)}
+
+# UTC offsets (in hours) of usual, unambiguous, time zone abbreviations. Ambiguous
+# ones (e.g. CST: US Central or China, BST: British Summer or Bangladesh) are left
+# out, they are taken as the time zone of this host.
+TIME_ZONES = {
+    'UTC' :   0, 'GMT' :   0, 'WET' :   0, 'WEST':   1,
+    'CET' :   1, 'CEST':   2, 'MET' :   1, 'MEST':   2, 'EET' :   2, 'EEST':   3, 'MSK' : 3,
+    'HKT' :   8, 'AWST':   8, 'JST' :   9, 'KST' :   9, 'ACST': 9.5, 'AEST':  10, 'AEDT': 11,
+    'NZST':  12, 'NZDT':  13,
+    'EST' :  -5, 'EDT' :  -4, 'MST' :  -7, 'MDT' :  -6,
+    'PST' :  -8, 'PDT' :  -7, 'AKST':  -9, 'AKDT':  -8, 'HST' : -10,
+}
+
+def parse_LOCAL_TIME(stripped_value):
+    # Example:
+    #     Mon Jul 31 11:54:59 2023 CEST
+    #
+    # Returns the corresponding epoch. Unambiguous abbreviations give their offset.
+    # Otherwise the time zone of this host, which is usually where smart_logger has
+    # run, is used: with daylight saving time as told by the abbreviation when it is
+    # one of the host (e.g. CST or CDT on a US Central host), so that the repeated
+    # hour of the end of daylight saving time is not taken twice.
+    _, month, day, hh_mm_ss, year, *time_zone = stripped_value.split()
+
+    hh, mm, ss = hh_mm_ss.split(':')
+    time_tuple = (int(year), MONTHS[month], int(day), int(hh), int(mm), int(ss))
+
+    time_zone = time_zone[0] if time_zone else ''
+
+    if time_zone in TIME_ZONES:
+        return calendar.timegm(time_tuple) - round(TIME_ZONES[time_zone] * 3600)
+
+    if time_zone in time.tzname and time.tzname[0] != time.tzname[1]:
+        return int(time.mktime(time_tuple + (0, 0, int(time_zone == time.tzname[1]))))
+
+    if re.fullmatch(r'[+-]\d{4}', time_zone):     # e.g. +0200
+        offset = int(time_zone[1:3]) * 3600 + int(time_zone[3:5]) * 60
+        return calendar.timegm(time_tuple) - (offset if time_zone[0] == '+' else -offset)
+
+    return int(time.mktime(time_tuple + (0, 0, -1)))
+
+# smart_logger names its logs after the UTC date and time: YYYY-MM-DD_HHMM.txt
+# (or YYYY-MM-DD_HHMM.json, see LOG_EXTENSIONS)
+LOG_FILENAME_DATE = re.compile(r'(\d{4})-(\d{2})-(\d{2})_(\d{2})(\d{2})')
+
+def parse_LOG_FILENAME_DATE(logname):
+    match = LOG_FILENAME_DATE.match(os.path.basename(logname))
+    if match is None:
+        return None
+
+    return calendar.timegm(tuple(int(group) for group in match.groups()) + (0,))
+
+#======================================================================
+# A smartctl log is parsed into a flat "sample" dictionary:
+#
+#     sample['Serial Number'], ['Model Family'], ['Device Model'], ['Device is']
+#     sample['date']                     epoch (seconds)
+#     sample['ATTRIBUTE_NAME'][id]       and likewise 'FLAG', 'TYPE', 'WHEN_FAILED'
+#     sample['METRICS'][id]              (VALUE, WORST, THRESH, RAW_VALUE, RAW_MIN, RAW_MAX)
+#     sample['samples']                  number of logs it stands for, when not 1 (aggregates)
+#
+# Samples of a same disk are then gathered by build_SMART_DATA() into columnar
+# arrays (see below).
+
+METRICS = ('VALUE', 'WORST', 'THRESH', 'RAW_VALUE', 'RAW_MIN', 'RAW_MAX')
+
+def new_SMART_SAMPLE():
+    return {
+        'Serial Number' : 'unknown',
+        'Model Family'  : 'unknown',
+        'Device Model'  : 'unknown',
+        'Device is'     : 'unknown',
+        'date'          : None,
+        'ATTRIBUTE_NAME': dict(),
+        'FLAG'          : dict(),
+        'TYPE'          : dict(),
+        'WHEN_FAILED'   : dict(),
+        'METRICS'       : dict(),
+    }
+
+def parse_START_OF_INFORMATION_SECTION(fp, sample):
     seek_for_pattern(fp, '=== START OF INFORMATION SECTION ===')
 
     # === START OF INFORMATION SECTION ===
@@ -186,92 +510,34 @@ def parse_START_OF_INFORMATION_SECTION(fp, smart_infos):
     # ...
     # Local Time is:    Sat Jul 29 11:19:39 2023 CEST
     # ...
-    Model_Family = 'unknown'
-    Device_Model = 'unknown'
-    Device_Is    = 'unknown'
-
     for line_with_CRLF in fp:
         line = line_with_CRLF.rstrip()
 
         if len(line) < 1:
-            # TODO: sanity check to ensure Serial_Number and Date has been found
-            assert(Serial_Number != 'unknown')
-            assert(Device_Is     != 'unknown')
-
-            smart_infos[Serial_Number]['Model Family'] = Model_Family
-            smart_infos[Serial_Number]['Device Model'] = Device_Model
-            smart_infos[Serial_Number]['Device is'   ] = Device_Is
-            smart_infos[Serial_Number]['date'        ].append(Date)
             break
 
         name, value = line.partition(":")[::2]
         stripped_name  = name.strip()
         stripped_value = value.strip()
 
-        if   stripped_name == 'Device is':
-            Device_Is    = stripped_value
-
-        elif stripped_name == 'Model Family':
-            Model_Family = stripped_value
-
-        elif stripped_name == 'Device Model':
-            Device_Model = stripped_value
+        if stripped_name in ['Device is', 'Model Family', 'Device Model', 'Serial Number']:
+            sample[stripped_name] = stripped_value
 
-        elif stripped_name == 'Serial Number':
-            Serial_Number = stripped_value
-
-            create_dict(smart_infos, Serial_Number)
-
-            # TODO: shall not assume that these variables are already defined
-
-            # smart_infos[Serial_Number]['Model Family'] = Model_Family
-            # smart_infos[Serial_Number]['Device Model'] = Device_Model
-            # smart_infos[Serial_Number]['Device is'   ] = Device_Is
-
-        elif stripped_name == 'Local Time is':
+        elif stripped_name == 'Local Time is' and sample['date'] is None:
             # Example:
             #     Local Time is:    Mon Jul 31 11:54:59 2023 CEST
-            #
-            # We need to convert to: 2023-07-31_11:54
+            sample['date'] = parse_LOCAL_TIME(stripped_value)
 
-            #### First method
-            # splitted_date = stripped_value.split(' ')
-            # YYYY = splitted_date[4]
-            # MM   = splitted_date[1]   # Jan Feb Mar Apr May Jun ...
-            # DD   = splitted_date[2]
-            # YYYY_MM_DD = YYYY + ' ' + MM + ' ' + DD
+    check_SMART_SAMPLE(sample)
 
-            # %Y     year
-            # %b     locale's abbreviated month name (e.g., Jan)
-            # %d     day of month (e.g., 01)
+    return sample
 
-            # date = datetime.strptime(YYYY_MM_DD, '%Y %b %d')
-
-            #### Second method
-            # first we need to remove leading CEST or whatever
-            #     Local Time is:    Mon Jul 31 11:54:59 2023 CEST
-            #                                                ^^^^
-            date_noTZ = ' '.join(stripped_value.split()[:5])
-
-            # %c     locale's date and time (e.g., Thu Mar  3 23:05:25 2005)
-
-            Date = datetime.strptime(date_noTZ, '%c').strftime(DATE_FORMAT)
-            # print('    date and time is: ', Date)
-
-            #### Third method
-            # cmd  = 'LC_TIME="en_US.UTF-8"  date'
-            # arg1 = '-d' + stripped_value
-            # arg2 = '-u'
-            # arg3 = '+' + DATE_FORMAT                 # '--rfc-3339=seconds'
-            # result = subprocess.run([cmd, arg1, arg2, arg3], stdout=subprocess.PIPE)
-            # Date = result.stdout.decode('utf-8').strip()
-            # print('    UTC date and time is: ', Date)
-
-            create_list(smart_infos[Serial_Number], 'date')
-
-            # smart_infos[Serial_Number]['date'].append(Date)
-
-    return smart_infos[Serial_Number]
+def check_SMART_SAMPLE(sample):
+    # sanity checks, ValueError for logs that cannot be used
+    if sample['Serial Number'] == 'unknown':
+        raise ValueError('Serial Number not found')
+    if sample['date'] is None:
+        raise ValueError('date not found')
 
 # SMART_DATA_HEADERS_str = \
 #  'ID# ATTRIBUTE_NAME          FLAG     VALUE WORST THRESH TYPE      UPDATED  WHEN_FAILED RAW_VALUE'
@@ -302,7 +568,7 @@ def parse_START_OF_INFORMATION_SECTION(fp, smart_infos):
 ## 202 Data_Address_Mark_Errs  0x0032   100   253   000    Old_age   Always       -       0
 #'''
 
-def parse_START_OF_READ_SMART_DATA_SECTION(fp, smart_data):
+def parse_START_OF_READ_SMART_DATA_SECTION(fp, sample, attributes=None):
     seek_for_pattern(fp, '=== START OF READ SMART DATA SECTION ===')
 
     # === START OF READ SMART DATA SECTION ===
@@ -312,81 +578,378 @@ def parse_START_OF_READ_SMART_DATA_SECTION(fp, smart_data):
     #   5 Reallocated_Sector_Ct   0x0033   100   100   010    Pre-fail  Always       -       0
     #   9 Power_On_Hours          0x0032   099   099   000    Old_age   Always       -       543
     # ...
-    seek_for_pattern(fp, SMART_DATA_HEADERS_str)
+    header_line = seek_for_pattern(fp, 'ID# ')
 
-    # line_with_CRLF will be now the next line after the one that contains 'ID# ATTRIBUTE_NAME ...'
+    # fp will be now at the next line after the one that contains 'ID# ATTRIBUTE_NAME ...'
+    parse_SMART_DATA_ROWS(fp, header_line, sample, attributes)
 
-    for line_with_CRLF in fp:
-        line = line_with_CRLF.rstrip()
+    return sample
 
-        if len(line) < 1:
-            break
+def parse_SMART_DATA_ROWS(fp, header_line, sample, attributes=None):
+    # attributes: set of attribute IDs to be kept, None for all
+    columns    = SMART_DATA_Columns(header_line)
+    nb_columns = len(columns)
+
+    get_fields = itemgetter(*[columns[col_name] for col_name in
+                              ['ID#', 'ATTRIBUTE_NAME', 'FLAG', 'VALUE', 'WORST', 'THRESH', 'WHEN_FAILED', 'RAW_VALUE']])
+    type_index = columns.get('TYPE')
+
+    attribute_names = sample['ATTRIBUTE_NAME']
+    flags           = sample['FLAG'          ]
+    types           = sample['TYPE'          ]
+    when_failed     = sample['WHEN_FAILED'   ]
+    metrics         = sample['METRICS'       ]
+
+    for line in fp:
+        fields = line.split(None, nb_columns - 1)
+
+        if len(fields) < nb_columns:
+            break   # blank line, end of table
+
+        attribute_id, name, flag, value, worst, thresh, failed, raw_value = get_fields(fields)
+
+        if attributes is not None and attribute_id not in attributes:
+            continue
+
+        attribute_names[attribute_id] = name
+        flags          [attribute_id] = flag
+        when_failed    [attribute_id] = failed     # TODO: to add function for processing WHEN_FAILED column
+
+        if type_index is not None:
+            types[attribute_id] = fields[type_index]
+        else:   # brief format: 'P' flag stands for Pre-fail
+            types[attribute_id] = 'Pre-fail' if flag.startswith('P') else 'Old_age'
+
+        metrics[attribute_id] = (to_int(value), to_int(worst), to_int(thresh)) + parse_RAW_VALUE(raw_value.rstrip())
+
+    return sample
+
+#======================================================================
+# smartctl JSON logs
+#
+# smartctl 7.x can output JSON (-j), which smart_logger writes as YYYY-MM-DD_HHMM.json.
+# Such logs are mapped to the very same samples as text logs:
+#
+#     "serial_number", "model_family", "model_name", "in_smartctl_database"
+#     "local_time": {"time_t": ...}                       -> 'date'
+#     "ata_smart_attributes": {"table": [
+#         {"id": 5, "name": "Reallocated_Sector_Ct", "value": 100, "worst": 100, "thresh": 36,
+#          "when_failed": "", "flags": {"value": 51, "prefailure": true, ...},
+#          "raw": {"value": 0, "string": "0"}}, ...]}       -> one attribute per row
+#
+# RAW_VALUE is parsed from the "raw" string, as displayed in text logs (the "raw"
+# value packs e.g. min/max temperatures into a 48 bits integer).
+#
+# NVMe drives have no attribute table but a health information log, whose fields
+# become attributes named after their JSON key: their RAW_VALUE is the field, and
+# available_spare also gets VALUE/THRESH (available_spare_threshold).
+
+JSON_WHEN_FAILED = {'': '-', 'now': 'FAILING_NOW', 'past': 'In_the_past'}
+
+JSON_DEVICE_IS   = {True : 'In smartctl database [for details use: -P show]',
+                    False: 'Not in smartctl database [for details use: -P showall]'}
+
+NVME_HEALTH_ATTRIBUTES = {
+    'critical_warning'    : 'Critical_Warning',
+    'temperature'         : 'Temperature_Celsius',
+    'available_spare'     : 'Available_Spare',
+    'percentage_used'     : 'Percentage_Used',
+    'data_units_read'     : 'Data_Units_Read',
+    'data_units_written'  : 'Data_Units_Written',
+    'host_reads'          : 'Host_Read_Commands',
+    'host_writes'         : 'Host_Write_Commands',
+    'controller_busy_time': 'Controller_Busy_Time',
+    'power_cycles'        : 'Power_Cycles',
+    'power_on_hours'      : 'Power_On_Hours',
+    'unsafe_shutdowns'    : 'Unsafe_Shutdowns',
+    'media_errors'        : 'Media_Data_Integrity_Errors',
+    'num_err_log_entries' : 'Error_Info_Log_Entries',
+    'warning_temp_time'   : 'Warning_Comp_Temp_Time',
+    'critical_comp_time'  : 'Critical_Comp_Temp_Time',
+}
+
+def parse_SMART_JSON(document, sample, attributes=None):
+    # attributes: set of attribute IDs to be kept, None for all
+    for key, json_key in [('Serial Number', 'serial_number'), ('Model Family', 'model_family'),
+                          ('Device Model' , 'model_name'   )]:
+        if json_key in document:
+            sample[key] = document[json_key]
+
+    if 'in_smartctl_database' in document:
+        sample['Device is'] = JSON_DEVICE_IS[document['in_smartctl_database']]
+
+    if sample['date'] is None:
+        sample['date'] = document['local_time']['time_t']
+
+    for row in document.get('ata_smart_attributes', dict()).get('table', []):
+        attribute_id = str(row['id'])
+
+        if attributes is not None and attribute_id not in attributes:
+            continue
+
+        sample['ATTRIBUTE_NAME'][attribute_id] = row['name']
+        sample['FLAG'          ][attribute_id] = f'0x{row["flags"]["value"]:04x}'
+        sample['TYPE'          ][attribute_id] = 'Pre-fail' if row['flags']['prefailure'] else 'Old_age'
+        when_failed = row.get('when_failed', '')     # the key may be missing
+        sample['WHEN_FAILED'   ][attribute_id] = JSON_WHEN_FAILED.get(when_failed, when_failed)
+
+        sample['METRICS'][attribute_id] = (row['value'], row['worst'], row['thresh']) + parse_RAW_VALUE(row['raw']['string'])
+
+    nvme_health = document.get('nvme_smart_health_information_log', dict())
+
+    for attribute_id, name in NVME_HEALTH_ATTRIBUTES.items():
+        if attribute_id not in nvme_health or (attributes is not None and attribute_id not in attributes):
+            continue
+
+        raw = nvme_health[attribute_id]
+
+        sample['ATTRIBUTE_NAME'][attribute_id] = name
+        sample['FLAG'          ][attribute_id] = '-'
+        sample['TYPE'          ][attribute_id] = 'NVMe'
+        sample['WHEN_FAILED'   ][attribute_id] = 'FAILING_NOW' if attribute_id == 'critical_warning' and raw else '-'
+
+        if attribute_id == 'available_spare':
+            value, thresh = raw, nvme_health.get('available_spare_threshold', MISSING)
+        else:
+            value, thresh = MISSING, MISSING
+
+        sample['METRICS'][attribute_id] = (value, MISSING, thresh, raw, MISSING, MISSING)
+
+    # same sanity checks as for text logs
+    check_SMART_SAMPLE(sample)
+
+    return sample
+
+#======================================================================
+# Columnar per-disk store
+#
+# All samples of a disk are gathered into:
+#
+#     smart_data['date']                 int64 epochs, shape (samples,), sorted
+#     smart_data['samples']              int64 number of logs each sample stands for, shape (samples,)
+#     smart_data['attribute_ids']        list of attribute IDs, one per column
+#     smart_data['VALUE']                masked int64 array, shape (samples, attributes)
+#     smart_data['WORST']   ...          likewise for every column of METRICS
+#     smart_data['ATTRIBUTE_NAME'][id]   latest known name, likewise 'FLAG', 'TYPE', 'WHEN_FAILED'
+#
+# An attribute that does not show up in a sample is masked for this sample, and so
+# are MISSING cells.
+
+def build_SMART_DATA(samples):
+    samples = sorted(samples, key=lambda sample: sample['date'])
+
+    smart_data = dict()
+
+    columns = dict()    # attribute_id -> column, in order of first appearance
+    for col_name in ['ATTRIBUTE_NAME', 'FLAG', 'TYPE', 'WHEN_FAILED']:
+        smart_data[col_name] = dict()
+
+    rows, cols, cells = [], [], []
+    for row, sample in enumerate(samples):
+        for key in ['Model Family', 'Device Model', 'Device is']:
+            smart_data[key] = sample[key]
+
+        for col_name in ['ATTRIBUTE_NAME', 'FLAG', 'TYPE', 'WHEN_FAILED']:
+            smart_data[col_name].update(sample[col_name])
+
+        for attribute_id, metrics in sample['METRICS'].items():
+            col = columns.setdefault(attribute_id, len(columns))
+
+            rows .append(row)
+            cols .append(col)
+            cells.append(metrics)
+
+    shape = (len(samples), len(columns))
+
+    absent = np.ones(shape, dtype=bool)
+    absent[rows, cols] = False
+
+    cells = np.array(cells, dtype=np.int64).reshape(-1, len(METRICS))
+
+    smart_data['date'         ] = np.array([sample['date'] for sample in samples], dtype=np.int64)
+    smart_data['samples'      ] = np.array([sample.get('samples', 1) for sample in samples], dtype=np.int64)
+    smart_data['attribute_ids'] = list(columns)
+
+    for k, col_name in enumerate(METRICS):
+        data = np.zeros(shape, dtype=np.int64)
+        data[rows, cols] = cells[:, k]
+
+        smart_data[col_name] = np.ma.MaskedArray(data, mask=absent | (data == MISSING))
+
+    return smart_data
+
+def build_SMART_INFOS(samples):
+    samples_per_disk = dict()
+    for sample in samples:
+        create_list(samples_per_disk, sample['Serial Number'])
 
-        # line = line.lstrip()
-        # splitted_line = re.split(' +', line)
-        # print(splitted_line)
-
-        # for i,j in SMART_DATA_Slices(PATTERN_for_SLICING_SMART_DATA):
-        #     # print(i,j)
-        #     # print('<' + line[i:j] + '>', end=' ')
-        for col_name, value in SMART_DATA_Headers_and_Values(line):
-            # print(col_name, value, end=' ')
-            # print(value, end=' ')
-
-            #============================================================
-            # create_list(smart_data, 'all columns')
-            #
-            # if col_name not in smart_data['all columns']:
-            #     smart_data['all columns'].append(col_name)
-            ##
-            #############
-            ## allternative solution, but we loose ordering
-            ##
-            ## create_set(smart_data, 'all columns')
-            ##
-            ## smart_data['all columns'].add(col_name)
-            ##
-            #============================================================
-            if   col_name == 'ID#':
-                attribute_id = value
-
-            elif col_name in ['ATTRIBUTE_NAME', 'FLAG', 'TYPE', 'WHEN_FAILED']:
-                create_dict(smart_data, col_name)
-
-                smart_data[col_name][attribute_id] = value
-
-            # TODO: to add function for processing WHEN_FAILED column
-            # elif col_name in ['VALUE','WORST','THRESH','WHEN_FAILED','RAW_VALUE']:
-            elif col_name in ['VALUE','WORST','THRESH','RAW_VALUE']:
-                create_dict(smart_data, col_name)
-
-                create_list(smart_data[col_name], attribute_id)
-
-                smart_data[col_name][attribute_id].append(int(value))
-                #========================================================
-                # create_list(smart_data, 'picked columns')
-                #
-                # if col_name not in smart_data['picked columns']:
-                #     smart_data['picked columns'].append(col_name)
-                ##
-                #############
-                ## allternative solution, but we loose ordering
-                ##
-                ## create_set(smart_data, 'picked columns')
-                ##
-                ## smart_data['all columns'].add(col_name)
-                ##
-            #============================================================
-        # print()
-
-def plot_VALUE_WORST_THRESH_data(ax, date_data, smart_data, attribute_id):
-    value_data  = smart_data['VALUE'    ][attribute_id]
-    worst_data  = smart_data['WORST'    ][attribute_id]
-    thresh_data = smart_data['THRESH'   ][attribute_id]
+        samples_per_disk[sample['Serial Number']].append(sample)
+
+    smart_infos = dict()
+    for disk_SN, samples in samples_per_disk.items():
+        with profile_stage('build-arrays', disk_SN):
+            smart_infos[disk_SN] = build_SMART_DATA(samples)
+
+    return smart_infos
+
+def append_SMART_DATA(smart_data, samples):
+    # appends samples (of the same disk) to smart_data, new attributes being
+    # added as new columns, masked for the former samples. Samples whose date is
+    # already there (e.g. logs loaded, then seen by the watch) are ignored.
+    known   = set(smart_data['date'].tolist())
+    samples = [sample for sample in samples if sample['date'] not in known]
+    if len(samples) == 0:
+        return smart_data
+
+    new_data = build_SMART_DATA(samples)
+
+    attribute_ids = smart_data['attribute_ids'] + [attribute_id for attribute_id in new_data['attribute_ids']
+                                                   if attribute_id not in smart_data['attribute_ids']]
+    columns = {attribute_id: col for col, attribute_id in enumerate(attribute_ids)}
+
+    def aligned(data, data_attribute_ids):
+        if len(data_attribute_ids) == len(attribute_ids):
+            return data
+
+        result = np.ma.masked_all((data.shape[0], len(attribute_ids)), dtype=np.int64)
+        result[:, [columns[attribute_id] for attribute_id in data_attribute_ids]] = data
+        return result
+
+    date  = np.concatenate([smart_data['date'], new_data['date']])
+    order = np.argsort(date, kind='stable')     # in case of late logs
+
+    for col_name in METRICS:
+        data = np.ma.concatenate([aligned(smart_data[col_name], smart_data['attribute_ids']),
+                                  aligned(new_data  [col_name], new_data  ['attribute_ids'])])
+        smart_data[col_name] = data[order]
+
+    smart_data['date'         ] = date[order]
+    smart_data['samples'      ] = np.concatenate([smart_data['samples'], new_data['samples']])[order]
+    smart_data['attribute_ids'] = attribute_ids
+
+    for key in ['Model Family', 'Device Model', 'Device is']:
+        smart_data[key] = new_data[key]
+
+    for col_name in ['ATTRIBUTE_NAME', 'FLAG', 'TYPE', 'WHEN_FAILED']:
+        smart_data[col_name].update(new_data[col_name])
+
+    return smart_data
+
+#======================================================================
+# Downsampling
+#
+# Years of hourly samples mean hundreds of thousands of points (and RAW_VALUE
+# markers) per figure, far more than the pixels of a subplot. With max_points,
+# every series is reduced to about max_points points: the min and the max of
+# equal-sized buckets of samples, plus the samples that shall never be dropped:
+#
+#     - the first and the latest samples,
+#     - VALUE crossing THRESH, THRESH changes, and gaps (masked samples),
+#     - RAW_VALUE step changes, as long as there are fewer than max_points of them
+#       (otherwise, e.g. Power_On_Hours, buckets min and max are enough).
+#
+# When zooming interactively, visible samples are downsampled again from the
+# full resolution data, so that details show up as soon as they fit.
+
+def changes_indices(data):
+    # indices on both sides of every change of data
+    changes = np.flatnonzero(data[1:] != data[:-1])
+    return np.concatenate([changes, changes + 1])
+
+def bucket_extrema_indices(data, nb_buckets):
+    # indices of the min and of the max of each bucket, masked samples being ignored
+    valid = np.flatnonzero(~np.ma.getmaskarray(data))
+    if valid.size == 0:
+        return valid
+
+    buckets = (valid * nb_buckets) // len(data)
+    values  = np.ma.getdata(data)[valid]
+
+    order   = np.lexsort((values, buckets))     # by bucket, then by value
+    buckets = buckets[order]
+    first   = np.concatenate([[True], buckets[1:] != buckets[:-1]])
+    last    = np.concatenate([buckets[1:] != buckets[:-1], [True]])
+
+    return valid[order[first | last]]
+
+def downsample_VALUE_WORST_THRESH_indices(value_data, worst_data, thresh_data, max_points):
+    nb_samples = len(value_data)
+    if nb_samples <= max_points:
+        return np.arange(nb_samples)
+
+    nb_buckets = max(max_points // 4, 1)    # min and max of both VALUE and WORST
+
+    failing = np.ma.filled(value_data <= thresh_data, False)
+
+    return np.unique(np.concatenate([
+        [0, nb_samples - 1],
+        bucket_extrema_indices(value_data, nb_buckets),
+        bucket_extrema_indices(worst_data, nb_buckets),
+        changes_indices(failing),
+        changes_indices(np.ma.filled(thresh_data, MISSING)),
+        changes_indices(np.ma.getmaskarray(value_data)),
+    ]))
+
+def downsample_RAW_VALUE_indices(raw_data, max_points):
+    nb_samples = len(raw_data)
+    if nb_samples <= max_points:
+        return np.arange(nb_samples)
+
+    steps = changes_indices(np.ma.filled(raw_data, MISSING))
+    if len(steps) > max_points:
+        steps = steps[:0]
+
+    return np.unique(np.concatenate([
+        [0, nb_samples - 1],
+        bucket_extrema_indices(raw_data, max(max_points // 2, 1)),
+        steps,
+    ]))
+
+def VALUE_WORST_THRESH_series(day_axis, smart_data, column, max_points=None, xlim=None):
+    # returns (day_axis, VALUE, WORST, THRESH), (day_axis, RAW_VALUE), downsampled
+    # within xlim when max_points is given
+    value_data  = smart_data['VALUE'    ][:, column]
+    worst_data  = smart_data['WORST'    ][:, column]
+    thresh_data = smart_data['THRESH'   ][:, column]
+    raw_data    = smart_data['RAW_VALUE'][:, column]
+
+    if max_points is None:
+        return (day_axis, value_data, worst_data, thresh_data), (day_axis, raw_data)
+
+    lo, hi = 0, len(day_axis)
+    if xlim is not None:    # plus one sample on both sides, for lines to reach the edges
+        lo = max(np.searchsorted(day_axis, min(xlim), 'left' ) - 1, 0 )
+        hi = min(np.searchsorted(day_axis, max(xlim), 'right') + 1, hi)
+
+    indices     = lo + downsample_VALUE_WORST_THRESH_indices(value_data[lo:hi], worst_data[lo:hi],
+                                                             thresh_data[lo:hi], max_points)
+    raw_indices = lo + downsample_RAW_VALUE_indices(raw_data[lo:hi], max_points)
+
+    return (day_axis[indices], value_data[indices], worst_data[indices], thresh_data[indices]), \
+           (day_axis[raw_indices], raw_data[raw_indices])
+
+def set_VALUE_WORST_THRESH_data(lines, smart_data, attribute_id, max_points=None, xlim=None):
+    l1,l2,l3,l4 = lines
+
+    column   = smart_data['attribute_ids'].index(attribute_id)
+    day_axis = days_before(smart_data['date'], smart_data['date'][-1])
+
+    (x, value_data, worst_data, thresh_data), (raw_x, raw_data) = \
+        VALUE_WORST_THRESH_series(day_axis, smart_data, column, max_points, xlim)
+
+    l1.set_data(x, value_data )
+    l2.set_data(x, worst_data )
+    l3.set_data(x, thresh_data)
+    l4.set_data(raw_x, raw_data)
+
+def plot_VALUE_WORST_THRESH_data(ax, date_data, smart_data, column, max_points=None):
+    (x, value_data, worst_data, thresh_data), (raw_x, raw_data) = \
+        VALUE_WORST_THRESH_series(date_data, smart_data, column, max_points)
 
     ax.set_ylim(-10, 210)
     ax.grid()
 
+    attribute_id   = smart_data['attribute_ids' ][column]
     attribute_name = smart_data['ATTRIBUTE_NAME'][attribute_id]
     attribute_type = smart_data['TYPE'          ][attribute_id]
 
@@ -399,53 +962,60 @@ def plot_VALUE_WORST_THRESH_data(ax, date_data, smart_data, attribute_id):
     ax.xaxis.set_label_coords(1.05, -0.06)
 
     # blue, green, red, cyan, magenta, yellow, black, and white
-    l1, = ax.plot(date_data, value_data, label='VALUE' , color='blue' , linestyle='solid'  )
-    l2, = ax.plot(date_data, worst_data, label='WORST' , color='red'  , linestyle='dotted' )
-    l3, = ax.plot(date_data,thresh_data, label='THRESH', color='green', linestyle='dashdot')
+    l1, = ax.plot(x, value_data, label='VALUE' , color='blue' , linestyle='solid'  )
+    l2, = ax.plot(x, worst_data, label='WORST' , color='red'  , linestyle='dotted' )
+    l3, = ax.plot(x,thresh_data, label='THRESH', color='green', linestyle='dashdot')
          
     twin_ax = ax.twinx()
 
-    raw_data    = smart_data['RAW_VALUE'][attribute_id]
-    if raw_data[-1] == 0:
+    raw_known   = smart_data['RAW_VALUE'][:, column].compressed()
+    if raw_known.size and raw_known[-1] == 0:
         twin_ax.plot([0],[0], color='green', marker='<', markersize=10)
 
-    l4, = twin_ax.plot(date_data, raw_data, label='RAW_VALUE', color='blue', linestyle='dotted', marker='+')
+    l4, = twin_ax.plot(raw_x, raw_data, label='RAW_VALUE', color='blue', linestyle='dotted', marker='+')
+
+    if max_points is not None:
+        # zooming: downsample visible samples again, from full resolution data
+        def on_xlim_changed(ax):
+            set_VALUE_WORST_THRESH_data((l1,l2,l3,l4), smart_data, attribute_id, max_points, ax.get_xlim())
+
+        ax.callbacks.connect('xlim_changed', on_xlim_changed)
 
     return l1,l2,l3,l4
 
-def days_between(d1, d2):
-    d1 = datetime.strptime(d1, DATE_FORMAT)
-    d2 = datetime.strptime(d2, DATE_FORMAT)
+def has_SUBPLOTS(smart_data, disk_SN):
+    # a disk without any of the selected attributes (--attributes), e.g. an NVMe disk
+    # among ATA ones, has no subplot: it is skipped rather than aborting the whole run
+    if len(smart_data['attribute_ids']) == 0:
+        print(f'    WARNING: {disk_SN}: none of the selected attributes, no figure', file=sys.stderr)
+        return False
 
-    delta_seconds = (d2-d1).days*24*3600 + (d2 - d1).seconds
-    delta_days = round(delta_seconds / (24*3600), 2)
+    return True
 
-    return delta_days
+def build_SMART_DATA_figure(smart_data, disk_SN, max_points=None):
+    import_PYPLOT()
 
-def plot_SMART_DATA(smart_infos, disk_SN):
-    smart_data = smart_infos[disk_SN]
+    with profile_stage('axis', disk_SN):
+        day_axis = np.round(days_before(smart_data['date'], smart_data['date'][-1]), 2)
 
-    oldest_date = smart_data['date'][ 0]
-    latest_date = smart_data['date'][-1]
-    print('oldest_date: ', oldest_date)
-    print('latest_date: ', latest_date)
-    day_axis = []
-    for current_date in smart_data['date']:
-        # delta_days = days_between(oldest_date, current_date)
-        delta_days = days_between(latest_date, current_date)
-        day_axis.append(delta_days)
-
-    print(day_axis)
-    print()
-    assert(day_axis == sorted(day_axis))
+    with profile_stage('render', disk_SN):
+        return build_SMART_DATA_subplots(smart_data, disk_SN, day_axis, max_points)
 
-    nb_attributes = len(smart_data['ATTRIBUTE_NAME'])
+def build_SMART_DATA_subplots(smart_data, disk_SN, day_axis, max_points=None):
+    latest_date = format_date(smart_data['date'][-1])
+
+    # day_axis: days before the latest sample
+    assert(np.all(np.diff(day_axis) >= 0))
+
+    nb_attributes = len(smart_data['attribute_ids'])
 
     ncols = 3
     nrows = math.ceil(nb_attributes / ncols)
 
-    fig, axs = plt.subplots(nrows=nrows, ncols=ncols, figsize=(20.48,11.52), layout='constrained')
-    fig.canvas.manager.full_screen_toggle() # toggle fullscreen mode
+    fig, axs = plt.subplots(nrows=nrows, ncols=ncols, figsize=(20.48,11.52), layout='constrained', squeeze=False)
+
+    if max_points == 0:     # pixel budget: a min and a max per pixel column of a subplot
+        max_points = 2 * int(fig.get_figwidth() * fig.dpi / ncols)
 
     Model_Family = smart_data['Model Family']
     Device_Model = smart_data['Device Model']
@@ -462,33 +1032,56 @@ def plot_SMART_DATA(smart_infos, disk_SN):
 
     # Data for plotting
 
-    for index, attribute_id in enumerate(smart_data['ATTRIBUTE_NAME']):
-        # attribute_name = smart_data['ATTRIBUTE_NAME'][attribute_id]
-        # print(index, attribute_id, attribute_name)
-
+    lines = dict()  # attribute_id -> (VALUE, WORST, THRESH, RAW_VALUE) Line2D
+    for index in range(nb_attributes):
         # row = index %  nrows
         # col = index // nrows
         row = index // ncols
         col = index %  ncols
         # print(row, col)
-        ls = plot_VALUE_WORST_THRESH_data(axs[row,col], day_axis, smart_data, attribute_id)
+        ls = plot_VALUE_WORST_THRESH_data(axs[row,col], day_axis, smart_data, index, max_points)
+
+        lines[smart_data['attribute_ids'][index]] = ls
 
         if (row,col == 0,0):
             fig.legend(ls, ('VALUE', 'WORST', 'THRESH', 'RAW_VALUE'), loc='upper left')
 
+    return fig, lines
+
+def plot_SMART_DATA(smart_infos, disk_SN, max_points=None, render_cache=None):
+    smart_data = smart_infos[disk_SN]
+
+    fig, lines = build_SMART_DATA_figure(smart_data, disk_SN, max_points)
+    fig.canvas.manager.full_screen_toggle() # toggle fullscreen mode
+
+    latest_date = format_date(smart_data['date'][-1])
+
     if __status__ == 'Production':
         fig_filename = latest_date + '_' + disk_SN   + '.png'
     else:
         fig_filename = latest_date + '_' + 'example' + '.png'
 
-    fig.savefig(fig_filename, bbox_inches='tight', dpi=100)
+    # the figure is shown anyway, but needs not be saved again
+    if render_cache is not None:
+        with profile_stage('digest', disk_SN):
+            digest = SMART_DATA_digest(smart_data, disk_SN, max_points)
+
+    if render_cache is None or not reuse_FIGURE(render_cache, digest, fig_filename):
+        with profile_stage('save', disk_SN):
+            fig.savefig(fig_filename, bbox_inches='tight', dpi=100)
+
+        if render_cache is not None:
+            store_FIGURE(render_cache, digest, fig_filename)
     # plt.tight_layout()
     plt.show()
 
-def plot_SMART_INFOS(smart_infos):
+def plot_SMART_INFOS(smart_infos, max_points=None, render_cache=None):
     print()
 
     for disk_SN in smart_infos:
+        if not has_SUBPLOTS(smart_infos[disk_SN], disk_SN):
+            continue
+
         Model_Family = smart_infos[disk_SN]['Model Family']
         Device_Model = smart_infos[disk_SN]['Device Model']
         
@@ -497,49 +1090,1798 @@ def plot_SMART_INFOS(smart_infos):
         print('Serial Number: ', disk_SN)
         print()
 
-        plot_SMART_DATA(smart_infos, disk_SN)
+        plot_SMART_DATA(smart_infos, disk_SN, max_points, render_cache)
+
+#======================================================================
+# Batch mode
+#
+# Figures are rendered with the non-interactive Agg backend, saved under outdir
+# as <latest_date>_<disk_SN>.png (one file per disk, whatever __status__ is, so
+# that disks do not overwrite each other) then closed right away. With jobs > 1,
+# disks are rendered concurrently by worker processes. With a figure cache, only
+# the disks whose data have changed are rendered, see SMART_DATA_digest().
+
+BATCH_BACKEND = 'Agg'
+
+def FIGURE_filename(smart_data, disk_SN, outdir):
+    return os.path.join(outdir, format_date(smart_data['date'][-1]) + '_' + disk_SN + '.png')
+
+def render_SMART_DATA(smart_data, disk_SN, outdir, max_points=None):
+    fig, lines = build_SMART_DATA_figure(smart_data, disk_SN, max_points)
 
-from glob import glob
+    fig_filename = FIGURE_filename(smart_data, disk_SN, outdir)
+
+    with profile_stage('save', disk_SN):
+        fig.savefig(fig_filename, bbox_inches='tight', dpi=100)
+    plt.close(fig)
+
+    return fig_filename
+
+def render_SMART_INFOS(smart_infos, outdir, jobs=1, max_points=None, render_cache=None):
+    os.makedirs(outdir, exist_ok=True)
+
+    import_PYPLOT(BATCH_BACKEND)
+
+    smart_infos = {disk_SN: smart_data for disk_SN, smart_data in smart_infos.items() if has_SUBPLOTS(smart_data, disk_SN)}
+
+    # unchanged disks first, in the parent: only changed ones are sent to workers
+    digests   = dict()
+    filenames = dict()
+    to_render = dict()
+    for disk_SN, smart_data in smart_infos.items():
+        if render_cache is not None:
+            with profile_stage('digest', disk_SN):
+                digests[disk_SN] = SMART_DATA_digest(smart_data, disk_SN, max_points)
+
+            fig_filename = FIGURE_filename(smart_data, disk_SN, outdir)
+            if reuse_FIGURE(render_cache, digests[disk_SN], fig_filename):
+                filenames[disk_SN] = fig_filename
+                continue
+
+        to_render[disk_SN] = smart_data
+
+    if jobs > 1 and len(to_render) > 1:
+        with ProcessPoolExecutor(max_workers=jobs, initializer=import_PYPLOT, initargs=(BATCH_BACKEND,)) as executor:
+            futures = {disk_SN: executor.submit(worker_task(render_SMART_DATA), smart_data, disk_SN, outdir, max_points)
+                       for disk_SN, smart_data in to_render.items()}
+
+            for disk_SN, future in futures.items():
+                filenames[disk_SN] = worker_result(future.result())
+    else:
+        for disk_SN, smart_data in to_render.items():
+            filenames[disk_SN] = render_SMART_DATA(smart_data, disk_SN, outdir, max_points)
+
+    if render_cache is not None:
+        for disk_SN in to_render:
+            store_FIGURE(render_cache, digests[disk_SN], filenames[disk_SN])
+
+        prune_RENDER_CACHE(render_cache)
+
+        print(f'{len(to_render)} figure(s) rendered, {len(smart_infos) - len(to_render)} unchanged', file=sys.stderr)
+
+    list_of_filenames = [filenames[disk_SN] for disk_SN in smart_infos]
+    for fig_filename in list_of_filenames:
+        print(fig_filename)
+
+    return list_of_filenames
 
 SMART_DIR = '/var/log/smart'
 
-def print_usage():
-    print(f'usage: {sys.argv[0]} [{SMART_DIR}/*/*.txt]')
+LOG_EXTENSIONS = ('.txt', '.json')     # smartctl text or JSON (-j) output
+
+#======================================================================
+# Compressed logs and archives
+#
+# Old logs may be compressed one by one (YYYY-MM-DD_HHMM.txt.gz, .json.xz, .txt.zst)
+# or rolled into tar archives (e.g. 2023-05.tar.gz, .tar.xz, .tar.zst, .tgz, plain
+# .tar) of such logs, under the same serial number directory. Both are decompressed
+# on the fly, tar archives being streamed member by member: nothing is extracted
+# to disk. .zst needs Python 3.14 or the zstandard module.
+#
+# A tar archive is a single file for the sample cache and for parallel ingestion,
+# that gives all the samples of its members. Decompression modules are only
+# imported when a compressed log or an archive is actually read.
+
+def open_GZIP(filename, mode='rb'):
+    import gzip
+    return gzip.open(filename, mode)
+
+def open_XZ(filename, mode='rb'):
+    import lzma
+    return lzma.open(filename, mode)
+
+def open_ZSTD(filename, mode='rb'):
+    try:                                # Python 3.14+
+        from compression import zstd
+    except ImportError:
+        try:
+            import zstandard as zstd    # pip install zstandard
+        except ImportError:
+            raise OSError(f'{filename}: zstd compressed, needs Python 3.14 or the zstandard module') from None
+
+    return zstd.open(filename, mode)
+
+COMPRESSIONS = {
+    '.gz'  : open_GZIP, '.tgz' : open_GZIP,
+    '.xz'  : open_XZ  , '.txz' : open_XZ  ,
+    '.zst' : open_ZSTD, '.tzst': open_ZSTD,
+}
+
+ARCHIVE_EXTENSIONS = ('.tar', '.tar.gz', '.tgz', '.tar.xz', '.txz', '.tar.zst', '.tzst')
+
+COMPRESSED_LOG_EXTENSIONS = tuple(extension + compression for extension in LOG_EXTENSIONS
+                                  for compression in ['.gz', '.xz', '.zst'])
+
+# whatever can be ingested
+LOG_FILE_EXTENSIONS = LOG_EXTENSIONS + COMPRESSED_LOG_EXTENSIONS + ARCHIVE_EXTENSIONS
+
+def open_LOG(filename, mode='rt', fileobj=None):
+    # fileobj: already opened binary file (e.g. archive member), named filename
+    opener = COMPRESSIONS.get(os.path.splitext(filename)[1])
+
+    if fileobj is None:
+        return (opener or open)(filename, mode)
+
+    if opener is not None:
+        return opener(fileobj, mode)
+
+    return io.TextIOWrapper(fileobj) if 't' in mode else fileobj
+
+def is_ARCHIVE(filename):
+    return filename.endswith(ARCHIVE_EXTENSIONS)
+
+#======================================================================
+# Parsed-sample cache
+#
+# Each log is parsed on its own into a sample (see new_SMART_SAMPLE()), each archive
+# into the samples of its logs. These samples are kept in pickle files, keyed by
+# the absolute path of the file and validated by its size and mtime, so that a rerun
+# only parses the files that have been added or modified since the previous run.
+#
+# The cache is a directory of shards, one pickle file per log directory (i.e. per
+# serial number), named after its quoted absolute path: a run only loads the shards
+# of the directories of its logs, and only rewrites those in which a log has been
+# parsed or has vanished. Nothing is written when nothing has changed.
+#
+# Files that cannot be parsed (truncated logs, smartctl errors, ...) are quarantined:
+# cached without samples but with the reason, so that they are neither parsed again
+# nor abort the run, until they are modified. An archive of which only some members
+# cannot be parsed is quarantined as well, cached with the samples of the others.
+
+XDG_CACHE_HOME = os.environ.get('XDG_CACHE_HOME', os.path.expanduser('~/.cache'))
+
+SAMPLE_CACHE         = os.path.join(XDG_CACHE_HOME, 'smart_graphic', 'samples')
+SAMPLE_CACHE_VERSION = 9
+
+def parse_SMART_LOG(logname, date_from_filename=False, attributes=None, fp=None):
+    # fp: log already opened (e.g. archive member), otherwise logname is opened
+    if fp is None:
+        with open_LOG(logname) as fp:
+            return parse_SMART_LOG(logname, date_from_filename, attributes, fp)
+
+    sample = new_SMART_SAMPLE()
+
+    if date_from_filename:
+        # "Local Time is" is then ignored by parse_START_OF_INFORMATION_SECTION()
+        sample['date'] = parse_LOG_FILENAME_DATE(logname)
+
+    disk_SN = os.path.basename(os.path.dirname(logname))    # for profiling only
+
+    # decompressed streams cannot always seek back, they are read at once
+    if not fp.seekable():
+        fp = io.StringIO(fp.read())
+
+    is_json = fp.read(1) == '{'     # smartctl -j
+    fp.seek(0)
+
+    if is_json:
+        with profile_stage('parse-json', disk_SN):
+            parse_SMART_JSON(json.load(fp), sample, attributes)
+
+        return sample
+
+    with profile_stage('parse-info', disk_SN):
+        parse_START_OF_INFORMATION_SECTION    (fp, sample)
+
+    with profile_stage('parse-attributes', disk_SN):
+        parse_START_OF_READ_SMART_DATA_SECTION(fp, sample, attributes)
+
+    return sample
+
+def parse_SMART_ARCHIVE(archive_name, date_from_filename=False, attributes=None):
+    # (samples of the logs of a tar archive in timestamp order, [reason of each skipped member])
+    import tarfile
+
+    directory = os.path.dirname(archive_name)
+
+    samples = []
+    skipped = []
+    with open_LOG(archive_name, 'rb') as fp, tarfile.open(fileobj=fp, mode='r|') as archive:
+        for member in archive:
+            name = os.path.basename(member.name)
+            if not member.isfile() or not name.endswith(LOG_EXTENSIONS + COMPRESSED_LOG_EXTENSIONS):
+                continue
+
+            # as if the member were in the directory of the archive
+            logname = os.path.join(directory, name)
+
+            # in memory: members of a streamed archive cannot be wrapped as they are
+            member_fp = io.BytesIO(archive.extractfile(member).read())
+
+            # an ill formatted member is skipped, not the whole archive
+            try:
+                with open_LOG(name, fileobj=member_fp) as log_fp:
+                    samples.append(parse_SMART_LOG(logname, date_from_filename, attributes, log_fp))
+            except Exception as e:
+                skipped.append(f'{member.name}: {describe_ERROR(e)}')
+
+    samples.sort(key=lambda sample: sample['date'])
+
+    return samples, skipped
+
+def parse_SMART_FILE(filename, date_from_filename=False, attributes=None):
+    # (list of the samples of a log, compressed log, archive or aggregate, [skipped archive members])
+    if is_ARCHIVE(filename):
+        return parse_SMART_ARCHIVE(filename, date_from_filename, attributes)
+
+    if AGGREGATE_period(filename) is not None:
+        return parse_SMART_AGGREGATE(filename, attributes), []
+
+    return [parse_SMART_LOG(filename, date_from_filename, attributes)], []
+
+def describe_ERROR(e):
+    return f'{type(e).__name__}: {e}'
+
+def try_SMART_FILE(filename, date_from_filename=False, attributes=None):
+    # (samples, None), or ([], reason) when the file cannot be parsed, or (samples, reason)
+    # when some members of an archive cannot: the archive is quarantined with its other samples
+    try:
+        samples, skipped = parse_SMART_FILE(filename, date_from_filename, attributes)
+    except Exception as e:  # truncated or ill formatted log, unreadable file, ...
+        return [], describe_ERROR(e)
+
+    if skipped:
+        return samples, f'{len(skipped)} member(s) skipped: ' + '; '.join(skipped)
+
+    return samples, None
+
+def SAMPLE_CACHE_shard(cache_name, directory):
+    return os.path.join(cache_name, quote(directory, safe='') + '.pickle')
+
+def SAMPLE_CACHE_directories(cache_name):
+    # directories of all the shards of the cache
+    try:
+        names = os.listdir(cache_name)
+    except FileNotFoundError:
+        return []
+
+    return [unquote(name.removesuffix('.pickle')) for name in names if name.endswith('.pickle')]
+
+def load_SAMPLE_CACHE(cache_name, directories=None):
+    # entries of the files of directories (absolute paths), default: all
+    if directories is None:
+        directories = SAMPLE_CACHE_directories(cache_name)
+
+    entries = dict()
+    for directory in directories:
+        shard_name = SAMPLE_CACHE_shard(cache_name, directory)
+        try:
+            with open(shard_name, 'rb') as fp:
+                shard = pickle.load(fp)
+
+        except FileNotFoundError:
+            continue
+
+        except Exception as e:  # truncated or unreadable shard, it will be rebuilt
+            print('    WARNING: ignoring sample cache: ', shard_name, e, file=sys.stderr)
+            continue
+
+        if shard.get('version') == SAMPLE_CACHE_VERSION:
+            entries.update(shard['entries'])
+
+    return entries
+
+def save_SAMPLE_CACHE(cache_name, entries, directories=None):
+    # rewrites the shards of directories from entries, default: all directories of entries
+    if directories is None:
+        directories = {os.path.dirname(path) for path in entries}
+
+    shards = {directory: dict() for directory in directories}
+    for path, entry in entries.items():
+        shard = shards.get(os.path.dirname(path))
+        if shard is not None:
+            shard[path] = entry
+
+    os.makedirs(cache_name, exist_ok=True)
+
+    for directory, shard in shards.items():
+        shard_name = SAMPLE_CACHE_shard(cache_name, directory)
+        if len(shard) == 0:
+            try:
+                os.remove(shard_name)
+            except FileNotFoundError:
+                pass
+            continue
+
+        # write then rename, so that an interrupted run never leaves a truncated shard
+        tmp_name = f'{shard_name}.{os.getpid()}.tmp'
+        with open(tmp_name, 'wb') as fp:
+            pickle.dump({'version': SAMPLE_CACHE_VERSION, 'entries': shard}, fp, protocol=pickle.HIGHEST_PROTOCOL)
+
+        os.replace(tmp_name, shard_name)
+
+def prune_SAMPLE_CACHE(cache_name):
+    # shards of the directories that have been removed, e.g. of a replaced disk
+    for directory in SAMPLE_CACHE_directories(cache_name):
+        if not os.path.isdir(directory):
+            try:
+                os.remove(SAMPLE_CACHE_shard(cache_name, directory))
+            except FileNotFoundError:
+                pass
+
+#======================================================================
+# Figure cache
+#
+# Rendering a figure (and saving it) is the most expensive part of a batch run,
+# while most disks have no new sample from one run to the next (e.g. drives in
+# standby are skipped by smartctl --nocheck=standby). Rendered figures are kept
+# in a content-addressed cache: named after a SHA-256 digest of what is drawn
+# (dates, attribute IDs, names and types, masked VALUE, WORST, THRESH and
+# RAW_VALUE, disk model and serial number) and of the render options, so that a
+# disk whose digest has not changed gets a copy of its former figure instead.
+# Cached figures that have not been used for RENDER_CACHE_DAYS are removed.
+# RENDER_CACHE_VERSION shall be increased whenever figures are drawn differently.
+
+RENDER_CACHE         = os.path.join(XDG_CACHE_HOME, 'smart_graphic', 'figures')
+RENDER_CACHE_VERSION = 1
+RENDER_CACHE_DAYS    = 30
+
+def SMART_DATA_digest(smart_data, disk_SN, max_points=None):
+    import hashlib      # only with a figure cache
+
+    attribute_ids = smart_data['attribute_ids']
+
+    digest = hashlib.sha256()
+    digest.update(repr((RENDER_CACHE_VERSION, __version__, __status__, mpl.__version__, max_points, disk_SN,
+                        smart_data['Model Family'], smart_data['Device Model'], attribute_ids,
+                        [smart_data['ATTRIBUTE_NAME'][attribute_id] for attribute_id in attribute_ids],
+                        [smart_data['TYPE'          ][attribute_id] for attribute_id in attribute_ids])).encode())
+
+    digest.update(smart_data['date'].tobytes())
+    for col_name in ['VALUE', 'WORST', 'THRESH', 'RAW_VALUE']:
+        # masked cells may hold anything, e.g. after append_SMART_DATA()
+        digest.update(np.ma.getmaskarray(smart_data[col_name]).tobytes())
+        digest.update(np.ma.filled(smart_data[col_name], 0).tobytes())
+
+    return digest.hexdigest()
+
+def copy_FIGURE(src_name, dst_name):
+    # copy then rename, so that an interrupted run never leaves a truncated figure
+    import shutil
+
+    tmp_name = f'{dst_name}.{os.getpid()}.tmp'
+    shutil.copyfile(src_name, tmp_name)
+    os.replace(tmp_name, dst_name)
+
+def reuse_FIGURE(render_cache, digest, fig_filename):
+    # copies the cached figure of digest to fig_filename, returns False if there is none
+    cached_name = os.path.join(render_cache, digest + '.png')
+    try:
+        os.utime(cached_name)       # still in use
+        if not os.path.exists(fig_filename) or not os.path.samefile(cached_name, fig_filename):
+            copy_FIGURE(cached_name, fig_filename)
+    except FileNotFoundError:
+        return False
+
+    return True
+
+def store_FIGURE(render_cache, digest, fig_filename):
+    os.makedirs(render_cache, exist_ok=True)
+    copy_FIGURE(fig_filename, os.path.join(render_cache, digest + '.png'))
+
+def prune_RENDER_CACHE(render_cache, days=RENDER_CACHE_DAYS):
+    oldest = time.time() - days * 24*3600
+    try:
+        with os.scandir(render_cache) as entries:
+            for entry in entries:
+                if entry.name.endswith('.png') and entry.stat().st_mtime < oldest:
+                    os.remove(entry.path)
+    except FileNotFoundError:
+        pass
+
+#======================================================================
+# Parallel ingestion
+#
+# Logs are dispatched to worker processes by serial number directory, large
+# directories being split into chunks of LOGS_PER_CHUNK logs, each archive being
+# a task on its own. Results are merged back by the parent in the very same order
+# as the serial path does, so that the resulting smart_infos are identical.
+
+LOGS_PER_CHUNK = 256
+
+def parse_SMART_FILES(list_of_filenames, date_from_filename=False, attributes=None):
+    # one (samples, error) per file, see try_SMART_FILE()
+    return [try_SMART_FILE(filename, date_from_filename, attributes) for filename in list_of_filenames]
+
+def parse_SMART_LOGS(list_of_lognames, date_from_filename=False, attributes=None):
+    samples = []
+    for logname, (file_samples, error) in zip(list_of_lognames,
+                                              parse_SMART_FILES(list_of_lognames, date_from_filename, attributes)):
+        if error is not None:
+            print(f'    WARNING: skipping {logname}: {error}', file=sys.stderr)
+
+        samples += file_samples
+
+    return samples
+
+def parse_SMART_FILES_in_parallel(list_of_filenames, jobs, date_from_filename=False, attributes=None):
+    chunks = dict()
+    tasks  = []
+    for filename in list_of_filenames:
+        if is_ARCHIVE(filename):
+            tasks.append([filename])
+            continue
+
+        create_list(chunks, os.path.dirname(filename))
+
+        chunks[os.path.dirname(filename)].append(filename)
+
+    for filenames in chunks.values():
+        for i in range(0, len(filenames), LOGS_PER_CHUNK):
+            tasks.append(filenames[i:i+LOGS_PER_CHUNK])
+
+    parsed_files = dict()
+    with ProcessPoolExecutor(max_workers=jobs) as executor:
+        task    = partial(parse_SMART_FILES, date_from_filename=date_from_filename, attributes=attributes)
+        results = executor.map(worker_task(task), tasks)
+
+        for filenames, result in zip(tasks, results):
+            parsed_files.update(zip(filenames, worker_result(result)))
+
+    return parsed_files
+
+#======================================================================
+# Selection of samples
+#
+# A window of time (since, until) and a set of attribute IDs can be given to
+# restrict what is loaded. Logs named after their date (YYYY-MM-DD_HHMM.txt) that
+# are outside of the window are not even opened, the other ones are filtered once
+# parsed. Attributes are filtered while parsing when the sample cache is not used
+# (otherwise complete samples are parsed and cached, then filtered).
+
+# smart_logger names all the logs of a run after the date the run started, so the
+# actual date of a log may be somewhat later than its name
+LOG_FILENAME_SLACK = 3600
+
+def to_epoch(when):
+    # when may be an epoch, a datetime (naive means UTC), a timedelta (that long ago)
+    # or a string as accepted by parse_DATE_ARGUMENT()
+    if when is None or isinstance(when, (int, float)):
+        return when
+
+    if isinstance(when, str):
+        return parse_DATE_ARGUMENT(when)
+
+    if isinstance(when, timedelta):
+        return time.time() - when.total_seconds()
+
+    if when.tzinfo is None:
+        return calendar.timegm(when.timetuple())
+
+    return when.timestamp()
+
+def parse_DATE_ARGUMENT(string):
+    # Examples:
+    #     2023-08-01            2023-08-01_1200     (UTC, as log names)
+    #     30d                   12h                 (that long ago)
+    if string[:-1].isdigit() and string[-1] in 'dh':
+        return time.time() - int(string[:-1]) * (24*3600 if string[-1] == 'd' else 3600)
+
+    for date_format in [DATE_FORMAT, '%Y-%m-%d']:
+        try:
+            return calendar.timegm(time.strptime(string, date_format))
+        except ValueError:
+            pass
+
+    raise ValueError(f'invalid date: {string} (expected YYYY-MM-DD, YYYY-MM-DD_HHMM, <N>d or <N>h)')
+
+def to_attribute_ids(attributes):
+    return None if attributes is None else {str(attribute_id) for attribute_id in attributes}
+
+def list_SMART_LOGS(root=SMART_DIR, serials=None, since=None, until=None):
+    # root/<disk_Serial_Number>/YYYY-MM-DD_HHMM.txt or .json, possibly compressed, or archives
+    if serials is None:
+        directories = [entry.path for entry in os.scandir(root) if entry.is_dir()]
+    else:
+        directories = [os.path.join(root, disk_SN) for disk_SN in serials]
+
+    list_of_lognames = []
+    for directory in directories:
+        try:
+            entries = list(os.scandir(directory))
+        except FileNotFoundError:
+            continue
+
+        for entry in entries:
+            if not entry.name.endswith(LOG_FILE_EXTENSIONS):
+                continue
+
+            date = parse_LOG_FILENAME_DATE(entry.name)
+            if date is not None:
+                # aggregates are named after the start of their period
+                period = AGGREGATE_period(entry.name)
+                span   = 0 if period is None else AGGREGATE_PERIODS[period]
+
+                if since is not None and date + span + LOG_FILENAME_SLACK < since:
+                    continue
+                if until is not None and date - LOG_FILENAME_SLACK > until:
+                    continue
+
+            list_of_lognames.append(entry.path)
+
+    list_of_lognames.sort()
+
+    return list_of_lognames
+
+def select_SAMPLE(sample, attributes):
+    # returns a copy of sample restricted to attributes, cached samples are never modified
+    selected = dict(sample)
+    for key in ['ATTRIBUTE_NAME', 'FLAG', 'TYPE', 'WHEN_FAILED', 'METRICS']:
+        selected[key] = {attribute_id: value for attribute_id, value in sample[key].items()
+                         if attribute_id in attributes}
+
+    return selected
+
+def load_SMART_INFOS(list_of_lognames, cache_name=None, rebuild_cache=False, jobs=1, date_from_filename=False,
+                     attributes=None, since=None, until=None, prune_cache=True, quarantine=None):
+    # quarantine: dict filled with {path: reason} of the files that could not be parsed
+    if quarantine is None:
+        quarantine = dict()
+
+    lognames_and_paths = [(logname, os.path.abspath(logname)) for logname in list_of_lognames]
+    directories        = {os.path.dirname(path) for logname, path in lognames_and_paths}
+
+    if cache_name is None or rebuild_cache:
+        entries = dict()
+    else:
+        with profile_stage('cache-load'):
+            entries = load_SAMPLE_CACHE(cache_name, directories)
+
+    # complete samples are needed for the cache, attributes are then selected afterwards
+    parsed_attributes = attributes if cache_name is None else None
+
+    list_of_paths = []
+    list_to_parse = []
+    with profile_stage('stat'):
+        for logname, path in lognames_and_paths:
+            try:
+                stat = os.stat(path)
+            except OSError as e:    # e.g. removed meanwhile
+                quarantine[path] = describe_ERROR(e)
+                continue
+
+            key = (stat.st_size, stat.st_mtime_ns, date_from_filename)
+
+            entry = entries.get(path)
+            if entry is None or entry[0] != key:
+                list_to_parse.append((logname, path, key))
+
+            list_of_paths.append(path)
+
+    lognames_to_parse = [logname for logname, path, key in list_to_parse]
+
+    if jobs > 1 and len(lognames_to_parse) > 1:
+        parsed_files = parse_SMART_FILES_in_parallel(lognames_to_parse, jobs, date_from_filename, parsed_attributes)
+    else:
+        parsed_files = dict(zip(lognames_to_parse, parse_SMART_FILES(lognames_to_parse, date_from_filename, parsed_attributes)))
+
+    for logname, path, key in list_to_parse:
+        samples, error = parsed_files[logname]
+        entries[path]  = (key, samples, error)
+
+        if error is not None:
+            print(f'    WARNING: quarantined: {logname}: {error}', file=sys.stderr)
+
+    # known bad files included, they are not parsed again
+    for path in list_of_paths:
+        if entries[path][2] is not None:
+            quarantine[path] = entries[path][2]
+
+    # a log may be found twice while being archived, e.g. as .txt and within a .tar.gz
+    samples = dict()
+    for path in list_of_paths:
+        for sample in entries[path][1]:
+            samples.setdefault((sample['Serial Number'], sample['date']), sample)
+    samples = list(samples.values())
+
+    if since is not None:
+        samples = [sample for sample in samples if sample['date'] >= since]
+    if until is not None:
+        samples = [sample for sample in samples if sample['date'] <= until]
+    if attributes is not None and parsed_attributes is None:
+        samples = [select_SAMPLE(sample, attributes) for sample in samples]
+
+    smart_infos = build_SMART_INFOS(samples)
+
+    # forget about logs that have been removed since they were cached, which only
+    # makes sense when the whole history has been listed
+    vanished = []
+    if prune_cache:
+        seen = set(list_of_paths)
+        vanished = [path for path in entries if path not in seen and not os.path.exists(path)]
+        for path in vanished:
+            del entries[path]
+
+    # only the shards in which something has changed are written
+    changed = {os.path.dirname(path) for logname, path, key in list_to_parse}
+    changed.update(os.path.dirname(path) for path in vanished)
+
+    nb_parsed  = len(list_to_parse)
+    nb_skipped = len(quarantine)
+
+    if __debug__ or nb_skipped:
+        print(f'{len(list_of_lognames)} logs, {nb_parsed} parsed, {len(list_of_lognames) - nb_parsed} from cache, '
+              f'{nb_skipped} skipped (quarantined)', file=sys.stderr)
+
+    if cache_name is not None:
+        with profile_stage('cache-save'):
+            if changed:
+                save_SAMPLE_CACHE(cache_name, entries, changed)
+            if prune_cache:
+                prune_SAMPLE_CACHE(cache_name)
+
+    return smart_infos
+
+def load_history(root=SMART_DIR, serials=None, since=None, until=None, attributes=None,
+                 cache_name=SAMPLE_CACHE, jobs=1, date_from_filename=False):
+    """ loads the history of the SMART data recorded by smart_logger under root
+
+    serials         serial numbers (i.e. directory names under root), default: all
+    since, until    window of time, as an epoch, a datetime (naive means UTC), a
+                    timedelta (that long ago) or a 'YYYY-MM-DD[_HHMM]', '30d', '12h' string
+    attributes      attribute IDs to be kept, e.g. [5, 197, 198], default: all
+    cache_name      parsed-sample cache directory, None not to use any: only the cache
+                    files of the listed serial numbers are read and, when new logs have
+                    been parsed, written
+
+    Returns smart_infos: {Serial Number: smart_data}, see build_SMART_DATA().
+
+    Example: last 30 days of IDs 5, 197 and 198 of two disks
+
+        load_history(serials=['WD-WCC4N4TRHD9U', 'Z1D2ABCD'], since='30d', attributes=[5, 197, 198])
+    """
+    since      = to_epoch(since)
+    until      = to_epoch(until)
+    attributes = to_attribute_ids(attributes)
+
+    with profile_stage('glob'):
+        list_of_lognames = list_SMART_LOGS(root, serials, since, until)
+
+    return load_SMART_INFOS(list_of_lognames, cache_name, jobs=jobs, date_from_filename=date_from_filename,
+                            attributes=attributes, since=since, until=until, prune_cache=False)
+
+#======================================================================
+# History compaction
+#
+# smart_logger writes one log per disk and per run, i.e. tens of thousands of small
+# files per disk after a few years. Logs older than a given date can be rolled up
+# into one aggregate per disk and per day or week, root/<disk_SN>/YYYY-MM-DD_0000.week.json
+# (named after the start of the period, in UTC, weeks starting on Monday):
+#
+#     {"smart_graphic_aggregate": 2, "period": "week", "Serial Number": ..., "samples": 168,
+#      "first": <epoch>, "last": <epoch>,
+#      "attributes": {"5": {"ATTRIBUTE_NAME": ..., "FLAG": ..., "TYPE": ..., "WHEN_FAILED": ...,
+#                           "first": {"VALUE": ..., "WORST": ..., ... "RAW_MAX": ...},
+#                           "last" : {...},
+#                           "min"  : {"VALUE": ..., "WORST": ..., "RAW_VALUE": ...},
+#                           "max"  : {...}}, ...}}
+#
+# Aggregates are read like any other log: each one gives back the actual first and
+# last samples of the period, at their dates, the last one standing for all the
+# other logs rolled up (sample['samples']), so that first to last changes and the
+# number of samples are those of the original logs. The extremes over the period
+# are kept apart (sample['EXTREMES'] of the last sample), they are not replayed
+# as values that never were at those dates. Only whole periods are compacted,
+# recent logs are left as they are. Compacting a period again (e.g. daily
+# aggregates into weekly ones, or late logs) merges the former aggregates.
+
+AGGREGATE_VERSION = 2
+AGGREGATE_PERIODS = {'day': 24*3600, 'week': 7*24*3600}
+
+AGGREGATED_METRICS = ('VALUE', 'WORST', 'RAW_VALUE')     # min and max over the period are kept
+
+def AGGREGATE_period(filename):
+    # 'day' or 'week' for aggregates, None for logs
+    name, extension = os.path.splitext(filename)
+    period = os.path.splitext(name)[1][1:]
+
+    return period if extension == '.json' and period in AGGREGATE_PERIODS else None
+
+def period_start(date, period):
+    # weeks start on Monday, the epoch being a Thursday
+    offset = 4*24*3600 if period == 'week' else 0
+    return date - (date - offset) % AGGREGATE_PERIODS[period]
+
+def optional_int(value, present):
+    return int(value) if present else None
+
+def merged_EXTREME(function, former, value):
+    return value if former is None else former if value is None else function(former, value)
+
+def build_AGGREGATE(samples, period):
+    smart_data = build_SMART_DATA(samples)
+
+    aggregate = {
+        'smart_graphic_aggregate': AGGREGATE_VERSION,
+        'period'                 : period,
+        'Serial Number'          : samples[0]['Serial Number'],
+        'Model Family'           : smart_data['Model Family'],
+        'Device Model'           : smart_data['Device Model'],
+        'Device is'              : smart_data['Device is'],
+        'samples'                : int(smart_data['samples'].sum()),
+        'first'                  : int(smart_data['date'][ 0]),
+        'last'                   : int(smart_data['date'][-1]),
+        'attributes'             : dict(),
+    }
+
+    first, latest = dict(), dict()
+    for col_name in METRICS:
+        first_values, latest_values, present = first_and_latest_values(smart_data[col_name])
+        first [col_name] = [optional_int(value, is_present) for value, is_present in zip(first_values , present)]
+        latest[col_name] = [optional_int(value, is_present) for value, is_present in zip(latest_values, present)]
+
+    # masked (i.e. absent) extremes are None, then merged with those of former aggregates
+    extremes = {'min': dict(), 'max': dict()}
+    for col_name in AGGREGATED_METRICS:
+        extremes['min'][col_name] = dict(zip(smart_data['attribute_ids'], smart_data[col_name].min(axis=0).tolist()))
+        extremes['max'][col_name] = dict(zip(smart_data['attribute_ids'], smart_data[col_name].max(axis=0).tolist()))
+
+    for sample in samples:
+        for attribute_id, former in sample.get('EXTREMES', dict()).items():
+            for col_name in AGGREGATED_METRICS:
+                for key, function in [('min', min), ('max', max)]:
+                    values = extremes[key][col_name]
+                    values[attribute_id] = merged_EXTREME(function, values.get(attribute_id), former[key][col_name])
+
+    for col, attribute_id in enumerate(smart_data['attribute_ids']):
+        attribute = {col_name: smart_data[col_name][attribute_id]
+                     for col_name in ['ATTRIBUTE_NAME', 'FLAG', 'TYPE', 'WHEN_FAILED']}
+
+        attribute['first'] = {col_name: first [col_name][col] for col_name in METRICS}
+        attribute['last' ] = {col_name: latest[col_name][col] for col_name in METRICS}
+        for key in ['min', 'max']:
+            attribute[key] = {col_name: extremes[key][col_name][attribute_id] for col_name in AGGREGATED_METRICS}
+
+        aggregate['attributes'][attribute_id] = attribute
+
+    return aggregate
+
+def parse_SMART_AGGREGATE(filename, attributes=None):
+    # first and last samples of an aggregate, see above
+    with open_LOG(filename) as fp:
+        aggregate = json.load(fp)
+
+    if aggregate.get('smart_graphic_aggregate') != AGGREGATE_VERSION:
+        raise ValueError(f'{filename}: not a version {AGGREGATE_VERSION} aggregate')
+
+    # (date, values, number of logs)
+    first, last, nb_samples = aggregate['first'], aggregate['last'], aggregate['samples']
+    if first < last:
+        replayed = [(first, 'first', 1), (last, 'last', nb_samples - 1)]
+    else:
+        replayed = [(last, 'last', nb_samples)]
+
+    samples = []
+    for date, key, nb_logs in replayed:
+        sample = new_SMART_SAMPLE()
+        for name in ['Serial Number', 'Model Family', 'Device Model', 'Device is']:
+            sample[name] = aggregate[name]
+        sample['date'   ] = date
+        sample['samples'] = nb_logs
+
+        for attribute_id, attribute in aggregate['attributes'].items():
+            if attributes is not None and attribute_id not in attributes:
+                continue
+
+            for col_name in ['ATTRIBUTE_NAME', 'FLAG', 'TYPE', 'WHEN_FAILED']:
+                sample[col_name][attribute_id] = attribute[col_name]
+
+            sample['METRICS'][attribute_id] = tuple(MISSING if attribute[key][col_name] is None else attribute[key][col_name]
+                                                    for col_name in METRICS)
+
+        samples.append(sample)
+
+    samples[-1]['EXTREMES'] = {attribute_id: {'min': attribute['min'], 'max': attribute['max']}
+                               for attribute_id, attribute in aggregate['attributes'].items()
+                               if attributes is None or attribute_id in attributes}
+
+    return samples
+
+def save_AGGREGATE(filename, aggregate):
+    # write then rename, logs are removed once their aggregate is complete
+    tmp_name = f'{filename}.{os.getpid()}.tmp'
+    with open(tmp_name, 'w') as fp:
+        json.dump(aggregate, fp, indent=1)
+
+    os.replace(tmp_name, filename)
+
+def compact_SMART_DIR(directory, before, period='week'):
+    # rolls up the logs (and shorter aggregates) of the whole periods before the date
+    # before into aggregates, returns (number of files compacted, number of aggregates)
+    periods = dict()    # period start -> filenames
+    for entry in os.scandir(directory):
+        if not entry.name.endswith(LOG_EXTENSIONS + COMPRESSED_LOG_EXTENSIONS):
+            continue
+
+        file_period = AGGREGATE_period(entry.name)
+        if file_period is not None and AGGREGATE_PERIODS[file_period] > AGGREGATE_PERIODS[period]:
+            continue
+
+        date = parse_LOG_FILENAME_DATE(entry.name)
+        if date is None:
+            continue
+
+        start = period_start(date, period)
+        if start + AGGREGATE_PERIODS[period] <= before:
+            create_list(periods, start)
+            periods[start].append(entry.path)
+
+    nb_files      = 0
+    nb_aggregates = 0
+    for start, filenames in sorted(periods.items()):
+        aggregate_name = os.path.join(directory, f'{format_date(start)}.{period}.json')
+        if filenames == [aggregate_name]:
+            continue    # already compacted
+
+        # files that cannot be parsed, even partly, are left as they are
+        samples = []
+        for filename in sorted(filenames):
+            file_samples, error = try_SMART_FILE(filename)
+            if error is not None:
+                print(f'    WARNING: {filename} not compacted: {error}', file=sys.stderr)
+                filenames.remove(filename)
+                continue
+
+            samples += file_samples
+
+        if not samples:
+            continue
+
+        # one aggregate per disk, should a directory hold several
+        samples_per_disk = dict()
+        for sample in samples:
+            create_list(samples_per_disk, sample['Serial Number'])
+            samples_per_disk[sample['Serial Number']].append(sample)
+
+        if len(samples_per_disk) != 1:
+            print(f'    WARNING: {directory}: {len(samples_per_disk)} serial numbers in {format_date(start)} '
+                  f'{period}, not compacted', file=sys.stderr)
+            continue
+
+        save_AGGREGATE(aggregate_name, build_AGGREGATE(samples, period))
+
+        for filename in filenames:
+            if filename != aggregate_name:
+                os.remove(filename)
+
+        nb_files      += len(filenames)
+        nb_aggregates += 1
+
+    return nb_files, nb_aggregates
+
+def compact_SMART_DIRS(directories, before, period='week'):
+    for directory in directories:
+        nb_files, nb_aggregates = compact_SMART_DIR(directory, before, period)
+
+        print(f'{directory}: {nb_files} files compacted into {nb_aggregates} {period} aggregate(s)')
+
+#======================================================================
+# Text and JSON summaries
+#
+# One entry per disk: latest VALUE, WORST, THRESH and RAW_VALUE of every attribute,
+# and the change of RAW_VALUE over the loaded window. A disk is
+#
+#     FAILING   when the VALUE of an attribute is at or below its (non zero) THRESH,
+#               or smartctl reports it as FAILING_NOW,
+#     WARNING   when WORST has been at or below THRESH, when smartctl reports an
+#               attribute that failed In_the_past, or when the RAW_VALUE of a
+#               critical attribute increased,
+#     OK        otherwise.
+#
+# Statuses map to the exit codes of Nagios plugins. No figure, hence no matplotlib.
+
+CRITICAL_ATTRIBUTES = ['5', '10', '184', '187', '188', '196', '197', '198', 'critical_warning', 'media_errors']
+
+SUMMARY_STATUSES = ['OK', 'WARNING', 'FAILING']  # index is the exit code
+
+def first_and_latest_values(data):
+    # first and latest unmasked value of each column, and whether there is any
+    valid  = ~np.ma.getmaskarray(data)
+    cols   = np.arange(data.shape[1])
+    first  = np.argmax(valid, axis=0)
+    latest = data.shape[0] - 1 - np.argmax(valid[::-1], axis=0)
+
+    return np.ma.getdata(data)[first, cols], np.ma.getdata(data)[latest, cols], valid.any(axis=0)
+
+def SMART_DATA_summary(smart_data, disk_SN):
+    attribute_ids = smart_data['attribute_ids']
+
+    latest  = dict()
+    present = dict()
+    for col_name in ['VALUE', 'WORST', 'THRESH']:
+        _, latest[col_name], present[col_name] = first_and_latest_values(smart_data[col_name])
+    raw_first, latest['RAW_VALUE'], present['RAW_VALUE'] = first_and_latest_values(smart_data['RAW_VALUE'])
+
+    with_thresh = present['VALUE'] & present['THRESH'] & (latest['THRESH'] > 0)
+    failing     = with_thresh & (latest['VALUE'] <= latest['THRESH'])
+    has_failed  = with_thresh & present['WORST'] & (latest['WORST'] <= latest['THRESH'])
+    raw_delta   = latest['RAW_VALUE'] - raw_first
+    critical    = np.isin(attribute_ids, CRITICAL_ATTRIBUTES) & present['RAW_VALUE']
+
+    attributes = dict()
+    status     = 'OK'
+    for col, attribute_id in enumerate(attribute_ids):
+        when_failed = smart_data['WHEN_FAILED'].get(attribute_id, '-')
+
+        reasons = []
+        if failing[col] or when_failed == 'FAILING_NOW':
+            reasons.append('failing')
+        if has_failed[col] or when_failed == 'In_the_past':
+            reasons.append('failed in the past')
+        if critical[col] and raw_delta[col] > 0:
+            reasons.append('RAW_VALUE increased')
+
+        if 'failing' in reasons:
+            status = 'FAILING'
+        elif reasons and status == 'OK':
+            status = 'WARNING'
+
+        attributes[attribute_id] = {
+            'ATTRIBUTE_NAME': smart_data['ATTRIBUTE_NAME'].get(attribute_id),
+            'WHEN_FAILED'   : when_failed,
+            'critical'      : bool(critical[col]),
+            'reasons'       : reasons,
+        }
+        for col_name in ['VALUE', 'WORST', 'THRESH', 'RAW_VALUE']:
+            attributes[attribute_id][col_name] = int(latest[col_name][col]) if present[col_name][col] else None
+        attributes[attribute_id]['RAW_delta'] = int(raw_delta[col]) if present['RAW_VALUE'][col] else None
+
+    return {
+        'Serial Number': disk_SN,
+        'Model Family' : smart_data['Model Family'],
+        'Device Model' : smart_data['Device Model'],
+        'status'       : status,
+        'samples'      : int(smart_data['samples'].sum()),     # logs, rolled up ones included
+        'oldest'       : format_date(smart_data['date'][ 0]),
+        'latest'       : format_date(smart_data['date'][-1]),
+        'attributes'   : attributes,
+    }
+
+def print_SUMMARY(smart_infos, output='text'):
+    summaries = [SMART_DATA_summary(smart_data, disk_SN) for disk_SN, smart_data in sorted(smart_infos.items())]
+
+    if output == 'json':
+        print(json.dumps(summaries, indent=4))
+    else:
+        for summary in summaries:
+            print(f'{summary["status"]:8} {summary["Serial Number"]:24} {summary["Device Model"]:24} '
+                  f'{summary["samples"]:6} samples  {summary["oldest"]} .. {summary["latest"]}')
+
+            # failing and critical attributes only
+            for attribute_id, attribute in summary['attributes'].items():
+                if not attribute['reasons'] and not (attribute['critical'] and attribute['RAW_VALUE']):
+                    continue
+
+                metrics = '  '.join(f'{col_name} {"-" if attribute[col_name] is None else attribute[col_name]}'
+                                    for col_name in ['VALUE', 'WORST', 'THRESH', 'RAW_VALUE'])
+                delta   = '' if attribute['RAW_delta'] is None else f'({attribute["RAW_delta"]:+})'
+                print(f'    {attribute_id:>3} {attribute["ATTRIBUTE_NAME"]:24} {metrics} {delta:>8}  '
+                      f'{", ".join(attribute["reasons"])}')
+
+    return max([SUMMARY_STATUSES.index(summary['status']) for summary in summaries], default=0)
+
+#======================================================================
+# Fleet overview
+#
+# All disks in a single figure: disks x critical attributes heatmaps of
+#
+#     margin      normalized VALUE to THRESH margin of the latest sample:
+#                 (VALUE - THRESH) / (best VALUE - THRESH), 1 being the best VALUE
+#                 ever seen and 0 THRESH (or below)
+#     raw_delta   increase of RAW_VALUE over the loaded window
+#
+# disks being sorted by risk: lowest margin first, then number and sum of RAW_VALUE
+# increases. Latest, first and best values of each disk are gathered into fleet
+# wide arrays, all the rest being computed at once on these arrays. Clicking on a
+# disk opens its own figure; in batch mode, per-disk figures are rendered as well.
+# Without any critical attribute loaded (--attributes), all loaded attributes are shown.
+
+FLEET_ANNOTATIONS = 100     # RAW_VALUE increases are written in cells up to that many disks
+
+def build_FLEET(smart_infos, attribute_ids=None):
+    if attribute_ids is None:
+        present       = set().union(*[smart_data['attribute_ids'] for smart_data in smart_infos.values()])
+        attribute_ids = [attribute_id for attribute_id in CRITICAL_ATTRIBUTES if attribute_id in present]
+        if len(attribute_ids) == 0:
+            # e.g. --attributes without any critical one: all loaded attributes
+            attribute_ids = sorted(present)
+
+    serials = list(smart_infos)
+    shape   = (len(serials), len(attribute_ids))
+
+    value, thresh, best_value, raw_first, raw_latest = [np.ma.masked_all(shape, dtype=np.int64) for _ in range(5)]
+
+    latest_dates    = np.zeros(len(serials), dtype=np.int64)
+    attribute_names = dict()
+    for row, disk_SN in enumerate(serials):
+        smart_data = smart_infos[disk_SN]
+        latest_dates[row] = smart_data['date'][-1]
+
+        columns    = {attribute_id: col for col, attribute_id in enumerate(smart_data['attribute_ids'])}
+        fleet_cols = [k for k, attribute_id in enumerate(attribute_ids) if attribute_id in columns]
+        disk_cols  = [columns[attribute_ids[k]] for k in fleet_cols]
+
+        for k in fleet_cols:
+            attribute_names.setdefault(attribute_ids[k], smart_data['ATTRIBUTE_NAME'][attribute_ids[k]])
+
+        for target, col_name in [(value, 'VALUE'), (thresh, 'THRESH')]:
+            _, latest, present = first_and_latest_values(smart_data[col_name][:, disk_cols])
+            target[row, fleet_cols] = np.ma.MaskedArray(latest, mask=~present)
+
+        first, latest, present = first_and_latest_values(smart_data['RAW_VALUE'][:, disk_cols])
+        raw_first [row, fleet_cols] = np.ma.MaskedArray(first , mask=~present)
+        raw_latest[row, fleet_cols] = np.ma.MaskedArray(latest, mask=~present)
+
+        best_value[row, fleet_cols] = smart_data['VALUE'][:, disk_cols].max(axis=0)
+
+    # fleet wide
+    # VALUE has never been above THRESH when best VALUE - THRESH <= 0: margin is 0
+    margin    = np.ma.clip((value - thresh) / np.ma.maximum(best_value - thresh, 1), 0, 1)
+    raw_delta = raw_latest - raw_first
+
+    increases = np.ma.filled(np.ma.clip(raw_delta, 0, None), 0)
+    worst     = np.ma.filled(margin.min(axis=1), 1.0) if len(attribute_ids) else np.ones(len(serials))
+    order     = np.lexsort((-increases.sum(axis=1), -(increases > 0).sum(axis=1), worst))
+
+    return {
+        'serials'       : [serials[row] for row in order],
+        'attribute_ids' : attribute_ids,
+        'ATTRIBUTE_NAME': attribute_names,
+        'margin'        : margin   [order],
+        'raw_delta'     : raw_delta[order],
+        'latest_date'   : int(latest_dates.max()) if len(serials) else 0,
+    }
+
+def build_FLEET_figure(fleet):
+    import_PYPLOT()
+
+    nb_disks, nb_attributes = fleet['margin'].shape
+
+    fig, (ax_margin, ax_raw) = plt.subplots(ncols=2, sharey=True, layout='constrained',
+                                            figsize=(20.48, max(5.0, 2.5 + 0.2 * nb_disks)))
+
+    fig.suptitle(f'{nb_disks} disks, sorted by risk - Latest check: {format_date(fleet["latest_date"])}')
+
+    margin_cmap = mpl.colormaps['RdYlGn'].with_extremes(bad='lightgray')
+    image = ax_margin.imshow(fleet['margin'], cmap=margin_cmap, vmin=0, vmax=1, aspect='auto', interpolation='nearest')
+    fig.colorbar(image, ax=ax_margin, label='(VALUE - THRESH) / (best VALUE - THRESH)')
+    ax_margin.set_title('VALUE to THRESH margin')
+
+    increases = np.ma.clip(fleet['raw_delta'], 0, None)
+    raw_cmap  = mpl.colormaps['Reds'].with_extremes(bad='lightgray')
+    image = ax_raw.imshow(np.ma.log10(1 + increases).filled(np.nan) if increases.count() else increases,
+                          cmap=raw_cmap, vmin=0, aspect='auto', interpolation='nearest')
+    fig.colorbar(image, ax=ax_raw, label='log10(1 + RAW_VALUE increase)')
+    ax_raw.set_title('RAW_VALUE increase')
+
+    if nb_disks <= FLEET_ANNOTATIONS:
+        for row, col in zip(*np.nonzero(np.ma.filled(increases, 0))):
+            ax_raw.text(col, row, f'+{increases[row, col]}', ha='center', va='center', fontsize='small')
+
+    serials = fleet['serials']
+    if __status__ != 'Production':
+        serials = [''.join(random.sample(disk_SN, len(disk_SN))) for disk_SN in serials]
+
+    labels = [f'{attribute_id}\n{fleet["ATTRIBUTE_NAME"][attribute_id]}' for attribute_id in fleet['attribute_ids']]
+    for ax in [ax_margin, ax_raw]:
+        ax.set_xticks(range(nb_attributes), labels, rotation=90, fontsize='small')
+    ax_margin.set_yticks(range(nb_disks), serials, fontsize='small' if nb_disks <= FLEET_ANNOTATIONS else 'xx-small')
+
+    return fig
+
+def plot_FLEET(smart_infos, fleet, max_points=None):
+    fig = build_FLEET_figure(fleet)
+
+    # click-through: figure of the disk of the clicked row
+    def on_click(event):
+        if event.inaxes not in fig.axes[:2] or event.button != 1:     # heatmaps, not colorbars
+            return
+
+        row = int(round(event.ydata))
+        if 0 <= row < len(fleet['serials']):
+            disk_SN = fleet['serials'][row]
+            if has_SUBPLOTS(smart_infos[disk_SN], disk_SN):
+                build_SMART_DATA_figure(smart_infos[disk_SN], disk_SN, max_points)[0].show()
+
+    fig.canvas.mpl_connect('button_press_event', on_click)
+
+    plt.show()
+
+def render_FLEET(fleet, outdir):
+    import_PYPLOT(BATCH_BACKEND)
+    os.makedirs(outdir, exist_ok=True)
+
+    fig = build_FLEET_figure(fleet)
+
+    fig_filename = os.path.join(outdir, format_date(fleet['latest_date']) + '_fleet.png')
+    with profile_stage('save'):
+        fig.savefig(fig_filename, bbox_inches='tight', dpi=100)
+    plt.close(fig)
+
+    print(fig_filename)
+
+    return fig_filename
+
+#======================================================================
+# Trend projection
+#
+# Straight lines are fitted (least squares) to the samples of the latest window
+# days of each disk, and to those of the window before it, for all attributes at
+# once: sums over the samples of a disk are taken column-wise on the masked arrays,
+# there is no loop over samples nor over attributes. From the slopes:
+#
+#     VALUE       decreasing towards a (non zero) THRESH: days until the latest
+#                 VALUE reaches THRESH at that pace, and the projected date
+#     RAW_VALUE   growth rate (per day) over the latest window, over the previous
+#                 one, and acceleration (change of rate per day)
+#
+# A disk is at risk when the VALUE of an attribute is projected to reach THRESH
+# within the horizon, or when the RAW_VALUE of a critical attribute grows clearly
+# faster than over the previous window: both slopes must have been fitted, and the
+# rate must exceed the previous one by TREND_MIN_ACCELERATION (relative) and by
+# TREND_MIN_RATE_INCREASE (absolute), so that a steady counter is not flagged from
+# the noise of its integer steps. Disks at risk are reported soonest crossing first.
+
+TREND_WINDOW            = 30      # days
+TREND_HORIZON           = 90      # days
+TREND_MIN_SAMPLES       = 3       # per window, for a slope to be fitted
+TREND_MIN_ACCELERATION  = 0.5     # RAW_VALUE rate at least 50 % above the previous one
+TREND_MIN_RATE_INCREASE = 0.1     # RAW_VALUE per day, i.e. 3 more per 30 days window
+
+def masked_slopes(days, data, in_window):
+    # least squares slope (per day) of each column of data, over the unmasked samples
+    # for which in_window is True; nan without enough samples
+    weights = (in_window[:, None] & ~np.ma.getmaskarray(data)).astype(np.float64)
+    values  = np.where(weights > 0, np.ma.getdata(data), 0).astype(np.float64)
+    days    = days[:, None]
+
+    with np.errstate(invalid='ignore', divide='ignore'):
+        count      = weights.sum(axis=0)
+        mean_day   = (weights * days  ).sum(axis=0) / count
+        mean_value = (weights * values).sum(axis=0) / count
+        centered   = weights * (days - mean_day)
+        slope      = (centered * (values - mean_value)).sum(axis=0) / (centered * (days - mean_day)).sum(axis=0)
+
+    slope[count < TREND_MIN_SAMPLES] = np.nan
+
+    return slope
+
+def SMART_DATA_trends(smart_data, window=TREND_WINDOW):
+    # days are counted from the latest sample of the disk, i.e. are <= 0
+    days     = days_before(smart_data['date'], smart_data['date'][-1])
+    latest   = days > -window
+    previous = (days > -2 * window) & ~latest
+
+    _, value, value_present   = first_and_latest_values(smart_data['VALUE' ])
+    _, thresh, thresh_present = first_and_latest_values(smart_data['THRESH'])
+    _, raw_value, raw_present = first_and_latest_values(smart_data['RAW_VALUE'])
+
+    value_slope  = masked_slopes(days, smart_data['VALUE'    ], latest  )
+    raw_rate     = masked_slopes(days, smart_data['RAW_VALUE'], latest  )
+    raw_previous = masked_slopes(days, smart_data['RAW_VALUE'], previous)
+
+    with_thresh = value_present & thresh_present & (thresh > 0)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        days_to_thresh = np.where(with_thresh & (value_slope < 0), (value - thresh) / -value_slope, np.inf)
+    days_to_thresh = np.where(with_thresh & (value <= thresh), 0, days_to_thresh)
+
+    return {
+        'VALUE'           : np.where(value_present , value    , MISSING),
+        'THRESH'          : np.where(thresh_present, thresh   , MISSING),
+        'RAW_VALUE'       : np.where(raw_present   , raw_value, MISSING),
+        'VALUE_slope'     : value_slope,
+        'days_to_THRESH'  : days_to_thresh,
+        'RAW_rate'        : raw_rate,
+        'RAW_previous'    : raw_previous,
+        'RAW_acceleration': (raw_rate - raw_previous) / window,
+    }
+
+def optional_float(value, digits=6):
+    return None if not math.isfinite(value) else round(float(value), digits)
+
+def build_TRENDS(smart_infos, window=TREND_WINDOW, horizon=TREND_HORIZON):
+    disks = []
+    for disk_SN, smart_data in sorted(smart_infos.items()):
+        with profile_stage('trends', disk_SN):
+            trends = SMART_DATA_trends(smart_data, window)
+
+        attribute_ids = smart_data['attribute_ids']
+        critical      = np.isin(attribute_ids, CRITICAL_ATTRIBUTES)
+        crossing      = trends['days_to_THRESH'] <= horizon
+        with np.errstate(invalid='ignore'):
+            increase     = trends['RAW_rate'] - trends['RAW_previous']     # nan without both fits
+            accelerating = (critical & (increase >= TREND_MIN_RATE_INCREASE)
+                                     & (increase >= TREND_MIN_ACCELERATION * np.abs(trends['RAW_previous'])))
+
+        latest_date = int(smart_data['date'][-1])
+
+        attributes = dict()
+        for col in np.flatnonzero(crossing | accelerating):
+            attribute_id = attribute_ids[col]
+
+            reasons = []
+            if crossing[col]:
+                reasons.append('VALUE reaching THRESH')
+            if accelerating[col]:
+                reasons.append('RAW_VALUE accelerating')
+
+            # only meaningful within the horizon: far projections are mere noise
+            days_to_thresh = optional_float(trends['days_to_THRESH'][col], 1) if crossing[col] else None
+            attributes[attribute_id] = {
+                'ATTRIBUTE_NAME'      : smart_data['ATTRIBUTE_NAME'].get(attribute_id),
+                'reasons'             : reasons,
+                'VALUE'               : None if trends['VALUE' ][col] == MISSING else int(trends['VALUE' ][col]),
+                'THRESH'              : None if trends['THRESH'][col] == MISSING else int(trends['THRESH'][col]),
+                'VALUE_per_day'       : optional_float(trends['VALUE_slope'][col]),
+                'days_to_THRESH'      : days_to_thresh,
+                'THRESH_date'         : None if days_to_thresh is None else
+                                        format_date(latest_date + days_to_thresh * 24*3600),
+                'RAW_VALUE'           : None if trends['RAW_VALUE'][col] == MISSING else int(trends['RAW_VALUE'][col]),
+                'RAW_per_day'         : optional_float(trends['RAW_rate'][col]),
+                'RAW_previous_per_day': optional_float(trends['RAW_previous'][col]),
+                'RAW_acceleration'    : optional_float(trends['RAW_acceleration'][col]),
+            }
+
+        if attributes:
+            disks.append({
+                'Serial Number' : disk_SN,
+                'Model Family'  : smart_data['Model Family'],
+                'Device Model'  : smart_data['Device Model'],
+                'latest'        : format_date(latest_date),
+                'days_to_THRESH': min([attribute['days_to_THRESH'] for attribute in attributes.values()
+                                       if attribute['days_to_THRESH'] is not None], default=None),
+                'attributes'    : attributes,
+            })
+
+    # soonest crossing first, then disks with accelerating RAW_VALUE only
+    disks.sort(key=lambda disk: (disk['days_to_THRESH'] is None, disk['days_to_THRESH'] or 0, disk['Serial Number']))
+
+    return {
+        'window_days' : window,
+        'horizon_days': horizon,
+        'disks'       : len(smart_infos),
+        'at_risk'     : disks,
+    }
+
+def print_TRENDS(report, output='text'):
+    if output == 'json':
+        print(json.dumps(report, indent=4))
+    else:
+        print(f'{len(report["at_risk"])} of {report["disks"]} disks at risk '
+              f'(window {report["window_days"]:g} days, horizon {report["horizon_days"]:g} days)')
+
+        for disk in report['at_risk']:
+            print(f'{disk["Serial Number"]:24} {disk["Device Model"]:24} latest {disk["latest"]}')
+
+            for attribute_id, attribute in disk['attributes'].items():
+                details = []
+                if attribute['days_to_THRESH'] == 0:
+                    details.append(f'VALUE {attribute["VALUE"]} already at or below THRESH {attribute["THRESH"]}')
+                elif attribute['days_to_THRESH'] is not None:
+                    details.append(f'VALUE {attribute["VALUE"]} -> THRESH {attribute["THRESH"]} '
+                                   f'in {attribute["days_to_THRESH"]:g} days ({attribute["THRESH_date"]})')
+                if 'RAW_VALUE accelerating' in attribute['reasons']:
+                    details.append(f'RAW_VALUE {attribute["RAW_VALUE"]} {attribute["RAW_per_day"]:+g}/day '
+                                   f'(before: {attribute["RAW_previous_per_day"]:+g}/day)')
+                print(f'    {attribute_id:>3} {attribute["ATTRIBUTE_NAME"]:24} {"  ".join(details)}')
+
+    # exit status of a Nagios WARNING when any disk is at risk
+    return SUMMARY_STATUSES.index('WARNING') if report['at_risk'] else 0
+
+#======================================================================
+# Follow mode
+#
+# SMART_DIR is polled every interval seconds. Polling is cheap: only the serial
+# number directories whose mtime has changed are listed again. New logs are
+# parsed, appended to the smart_data of their disk, and the existing Line2D of
+# the figure of this disk are updated in place: figures are not rebuilt and only
+# those of the disks that got new samples are redrawn. In batch mode, the figures
+# of these disks are rendered again. Compressed logs and archives are ignored:
+# they only hold logs that have been rotated, hence already seen.
+
+# a log whose mtime is more recent than that is assumed to be still written by smartctl
+LOG_SETTLE_TIME = 2
+
+def new_LOG_WATCH(root=SMART_DIR, serials=None):
+    watch = {'root': root, 'serials': serials, 'mtimes': dict(), 'seen': set(), 'pending': set()}
+
+    poll_LOG_WATCH(watch)   # logs that already exist are not new ones
+
+    return watch
+
+def poll_LOG_WATCH(watch):
+    # returns the sorted list of the logs that showed up since the previous poll
+    root = watch['root']
+
+    if watch['serials'] is None:
+        try:
+            directories = [entry.path for entry in os.scandir(root) if entry.is_dir()]
+        except FileNotFoundError:
+            directories = []
+    else:
+        directories = [os.path.join(root, disk_SN) for disk_SN in watch['serials']]
+
+    candidates = set(watch['pending'])
+    for directory in directories:
+        try:
+            mtime = os.stat(directory).st_mtime_ns
+        except FileNotFoundError:
+            continue
+
+        if watch['mtimes'].get(directory) == mtime:
+            continue
+
+        watch['mtimes'][directory] = mtime
+
+        try:
+            entries = list(os.scandir(directory))
+        except FileNotFoundError:
+            continue
+
+        for entry in entries:
+            if entry.name.endswith(LOG_EXTENSIONS) and AGGREGATE_period(entry.name) is None and \
+               entry.path not in watch['seen']:
+                candidates.add(entry.path)
+
+    # logs may vanish meanwhile, e.g. smart_logger removes the log of a failed smartctl
+    mtimes = dict()
+    for logname in candidates:
+        try:
+            mtimes[logname] = os.stat(logname).st_mtime
+        except FileNotFoundError:
+            pass
+
+    now = time.time()
+    candidates       = set(mtimes)
+    watch['pending'] = {logname for logname, mtime in mtimes.items() if now - mtime < LOG_SETTLE_TIME}
+
+    new_lognames = sorted(candidates - watch['pending'])
+    watch['seen'].update(new_lognames)
+
+    return new_lognames
+
+def update_SMART_DATA_figure(fig, lines, smart_data, max_points=None):
+    for attribute_id, ls in lines.items():
+        set_VALUE_WORST_THRESH_data(ls, smart_data, attribute_id, max_points)
+
+        l1,l2,l3,l4 = ls
+
+        l1.axes.relim()
+        l1.axes.autoscale_view(scaley=False)   # VALUE axis keeps its (-10, 210) range
+        l4.axes.relim()
+        l4.axes.autoscale_view()
+
+    fig_title = fig.get_suptitle().rpartition(' - ')[0]
+    fig.suptitle(f'{fig_title} - Latest check: {format_date(smart_data["date"][-1])}')
+
+    fig.canvas.draw_idle()
+
+def follow_SMART_INFOS(smart_infos, watch, interval, batch=False, outdir='.', max_points=None,
+                       date_from_filename=False, attributes=None, since=None, until=None, render_cache=None):
+    figures = dict()
+
+    if batch:
+        render_SMART_INFOS(smart_infos, outdir, max_points=max_points, render_cache=render_cache)
+    else:
+        import_PYPLOT()
+        plt.ion()
+        for disk_SN, smart_data in smart_infos.items():
+            if has_SUBPLOTS(smart_data, disk_SN):
+                figures[disk_SN] = build_SMART_DATA_figure(smart_data, disk_SN, max_points)
+        plt.show(block=False)
+
+    while batch or plt.get_fignums():
+        if batch:
+            time.sleep(interval)
+        else:
+            plt.pause(interval)
+
+        new_lognames = poll_LOG_WATCH(watch)
+        if len(new_lognames) == 0:
+            continue
+
+        samples = parse_SMART_LOGS(new_lognames, date_from_filename, attributes)
+        samples = [sample for sample in samples if (since is None or sample['date'] >= since) and
+                                                   (until is None or sample['date'] <= until)]
+
+        for disk_SN, new_data in build_SMART_INFOS(samples).items():
+            disk_samples = [sample for sample in samples if sample['Serial Number'] == disk_SN]
+
+            if disk_SN in smart_infos:
+                append_SMART_DATA(smart_infos[disk_SN], disk_samples)
+            else:
+                smart_infos[disk_SN] = new_data
+
+            print(f'{format_date(time.time())}: {len(disk_samples)} new sample(s) for {disk_SN}')
+
+            if not has_SUBPLOTS(smart_infos[disk_SN], disk_SN):
+                continue
+
+            if batch:
+                render_SMART_DATA(smart_infos[disk_SN], disk_SN, outdir, max_points)
+            elif disk_SN in figures:
+                update_SMART_DATA_figure(*figures[disk_SN], smart_infos[disk_SN], max_points)
+            else:
+                figures[disk_SN] = build_SMART_DATA_figure(smart_infos[disk_SN], disk_SN, max_points)
+                figures[disk_SN][0].show()
+
+#======================================================================
+# Metrics server
+#
+# --serve loads the history once, then keeps an in-memory index of the latest state of
+# each disk: its summary (latest VALUE, WORST, THRESH and RAW_VALUE, change of RAW_VALUE
+# over the loaded window and status, see SMART_DATA_summary()). SMART_DIR is polled as
+# in follow mode, and only the disks that got new samples are summarized and formatted
+# again. Responses are formatted ahead of time, so that a request only costs a lookup:
+#
+#     /metrics        Prometheus text format
+#     /json           summaries of all disks, as --json
+#     /json/<SN>      summary of a disk
+#
+# With --since, the window slides: samples older than the window are dropped as new
+# ones come. The server only listens on localhost by default.
+
+SERVE_ADDRESS = '127.0.0.1'
+
+PROMETHEUS_CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+JSON_CONTENT_TYPE       = 'application/json'
+
+# (metric, key of the summary of an attribute, help)
+PROMETHEUS_ATTRIBUTE_METRICS = [
+    ('smart_attribute_value'    , 'VALUE'    , 'Normalized VALUE of the latest sample.'),
+    ('smart_attribute_worst'    , 'WORST'    , 'WORST of the latest sample.'),
+    ('smart_attribute_threshold', 'THRESH'   , 'THRESH of the latest sample.'),
+    ('smart_attribute_raw_value', 'RAW_VALUE', 'RAW_VALUE of the latest sample.'),
+    ('smart_attribute_raw_delta', 'RAW_delta', 'Change of RAW_VALUE over the window.'),
+]
+
+PROMETHEUS_DISK_METRICS = [
+    ('smart_disk_status'                          , 'Summary status: 0 OK, 1 WARNING, 2 FAILING.'),
+    ('smart_disk_samples'                         , 'Number of samples in the window.'),
+    ('smart_disk_latest_sample_timestamp_seconds' , 'Date of the latest sample.'),
+]
+
+def prometheus_LABELS(labels):
+    def escaped(value):
+        return str(value).replace('\\', r'\\').replace('"', r'\"').replace('\n', r'\n')
+
+    return '{' + ','.join(f'{name}="{escaped(value)}"' for name, value in labels) + '}'
+
+def format_DISK_METRICS(summary, latest_date):
+    # lines of each metric for this disk
+    disk_labels = [('serial', summary['Serial Number']), ('model', summary['Device Model'])]
+
+    disk_values = [SUMMARY_STATUSES.index(summary['status']), summary['samples'], latest_date]
+
+    chunks = {metric: f'{metric}{prometheus_LABELS(disk_labels)} {value}\n'
+              for (metric, _), value in zip(PROMETHEUS_DISK_METRICS, disk_values)}
+
+    for metric, key, _ in PROMETHEUS_ATTRIBUTE_METRICS:
+        lines = []
+        for attribute_id, attribute in summary['attributes'].items():
+            if attribute[key] is not None:
+                labels = disk_labels + [('id', attribute_id), ('name', attribute['ATTRIBUTE_NAME'])]
+                lines.append(f'{metric}{prometheus_LABELS(labels)} {attribute[key]}\n')
+        chunks[metric] = ''.join(lines)
+
+    return chunks
+
+def index_SMART_DATA(index, smart_data, disk_SN):
+    summary = SMART_DATA_summary(smart_data, disk_SN)
+
+    index['disks'][disk_SN] = {
+        'summary': summary,
+        'metrics': format_DISK_METRICS(summary, int(smart_data['date'][-1])),
+        'json'   : json.dumps(summary, indent=4),
+    }
+
+def publish_SMART_INDEX(index):
+    # formats all responses from the chunks of the disks, then swaps them at once
+    disks = [index['disks'][disk_SN] for disk_SN in sorted(index['disks'])]
+
+    lines = []
+    for metric, help_text in [(metric, help_text) for metric, help_text in PROMETHEUS_DISK_METRICS] + \
+                             [(metric, help_text) for metric, _, help_text in PROMETHEUS_ATTRIBUTE_METRICS]:
+        lines.append(f'# HELP {metric} {help_text}\n# TYPE {metric} gauge\n')
+        lines.extend(disk['metrics'][metric] for disk in disks)
+
+    lines.append('# HELP smart_index_updated_timestamp_seconds Date of the latest update of the index.\n'
+                 '# TYPE smart_index_updated_timestamp_seconds gauge\n'
+                 f'smart_index_updated_timestamp_seconds {time.time():.3f}\n')
+
+    responses = {
+        '/metrics': (PROMETHEUS_CONTENT_TYPE, ''.join(lines).encode()),
+        '/json'   : (JSON_CONTENT_TYPE, ('[\n' + ',\n'.join(disk['json'] for disk in disks) + '\n]\n').encode()),
+    }
+    for disk_SN, disk in index['disks'].items():
+        responses[f'/json/{disk_SN}'] = (JSON_CONTENT_TYPE, (disk['json'] + '\n').encode())
+
+    index['responses'] = responses
+
+def new_SMART_INDEX(smart_infos):
+    index = {'disks': dict(), 'responses': dict()}
+
+    for disk_SN, smart_data in smart_infos.items():
+        index_SMART_DATA(index, smart_data, disk_SN)
+
+    publish_SMART_INDEX(index)
+
+    return index
+
+def trim_SMART_DATA(smart_data, since):
+    # drops the samples before since, but the latest one
+    keep     = smart_data['date'] >= since
+    keep[-1] = True
+    if keep.all():
+        return smart_data
+
+    smart_data['date'   ] = smart_data['date'   ][keep]
+    smart_data['samples'] = smart_data['samples'][keep]
+    for col_name in METRICS:
+        smart_data[col_name] = smart_data[col_name][keep]
+
+    return smart_data
+
+def update_SMART_INDEX(index, smart_infos, samples, window=None):
+    # adds new samples to smart_infos, then indexes the disks they belong to
+    for disk_SN, new_data in build_SMART_INFOS(samples).items():
+        disk_samples = [sample for sample in samples if sample['Serial Number'] == disk_SN]
+
+        if disk_SN in smart_infos:
+            append_SMART_DATA(smart_infos[disk_SN], disk_samples)
+        else:
+            smart_infos[disk_SN] = new_data
+
+        if window is not None:
+            trim_SMART_DATA(smart_infos[disk_SN], smart_infos[disk_SN]['date'][-1] - window)
+
+        index_SMART_DATA(index, smart_infos[disk_SN], disk_SN)
+
+    publish_SMART_INDEX(index)
+
+def start_SMART_SERVER(index, address=SERVE_ADDRESS, port=0):
+    # serves index['responses'] from a thread, port 0 for any free port (see server.server_port)
+    import threading
+    import http.server      # only with --serve, not to slow down the start of the other modes
+
+    class SMART_Handler(http.server.BaseHTTPRequestHandler):
+        def do_GET(self):
+            response = index['responses'].get(self.path.partition('?')[0].rstrip('/') or '/metrics')
+            if response is None:
+                self.send_error(404)
+                return
+
+            content_type, body = response
+            self.send_response(200)
+            self.send_header('Content-Type'  , content_type)
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, format, *args):   # no line on stderr per scrape
+            pass
+
+    server = http.server.ThreadingHTTPServer((address, port), SMART_Handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+
+    return server
+
+def serve_SMART_INFOS(smart_infos, watch, interval, address=SERVE_ADDRESS, port=9633,
+                      date_from_filename=False, attributes=None, window=None):
+    index  = new_SMART_INDEX(smart_infos)
+    server = start_SMART_SERVER(index, address, port)
+
+    print(f'serving http://{address}:{server.server_port}/metrics and /json ({len(smart_infos)} disks)',
+          file=sys.stderr)
+
+    try:
+        while True:
+            time.sleep(interval)
+
+            new_lognames = poll_LOG_WATCH(watch)
+            if len(new_lognames) == 0:
+                continue
+
+            samples = parse_SMART_LOGS(new_lognames, date_from_filename, attributes)
+            update_SMART_INDEX(index, smart_infos, samples, window)
+
+            print(f'{format_date(time.time())}: {len(samples)} new sample(s)', file=sys.stderr)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.shutdown()
+
+def parse_arguments(argv=None):
+    parser = argparse.ArgumentParser(description='graphically displays S.M.A.R.T. data that have been periodically collected over time.')
+
+    parser.add_argument('lognames', nargs='*', metavar='LOGFILE',
+                        help=f'smartctl logs or archives to be displayed (default: {SMART_DIR}/*/*.txt, *.json, '
+                             'compressed or archived)')
+    parser.add_argument('--cache', default=SAMPLE_CACHE, metavar='DIR',
+                        help=f'parsed-sample cache, one file per log directory (default: {SAMPLE_CACHE})')
+    parser.add_argument('--no-cache', action='store_true',
+                        help='neither read nor write the parsed-sample and figure caches')
+    parser.add_argument('--rebuild-cache', action='store_true',
+                        help='parse all logs again and rewrite the parsed-sample cache')
+    parser.add_argument('--quarantine', metavar='FILE',
+                        help='write the logs that could not be parsed (and are skipped until they are modified), '
+                             'with the reason, to FILE as JSON')
+    parser.add_argument('--render-cache', default=RENDER_CACHE, metavar='DIR',
+                        help=f'figures of the disks whose data have not changed are copied from DIR instead of '
+                             f'being rendered again (default: {RENDER_CACHE})')
+    parser.add_argument('-j', '--jobs', type=int, default=1, metavar='N',
+                        help='number of worker processes used to parse logs and render figures (0: one per CPU)')
+    parser.add_argument('--date-from-filename', action='store_true',
+                        help='take sample dates from YYYY-MM-DD_HHMM log names (UTC) instead of "Local Time is"')
+    parser.add_argument('--serial', action='append', dest='serials', metavar='SN',
+                        help=f'only load this disk, i.e. {SMART_DIR}/SN/ (may be repeated)')
+    parser.add_argument('--since', type=parse_DATE_ARGUMENT, metavar='DATE',
+                        help='only load samples since DATE: YYYY-MM-DD[_HHMM] (UTC) or <N>d, <N>h ago')
+    parser.add_argument('--until', type=parse_DATE_ARGUMENT, metavar='DATE',
+                        help='only load samples until DATE')
+    parser.add_argument('--attributes', type=lambda string: string.split(','), metavar='ID,ID,...',
+                        help='only load these attribute IDs, e.g. 5,197,198')
+    parser.add_argument('--follow', type=float, nargs='?', const=60, metavar='SECONDS',
+                        help='keep watching the log directory (see --root) for new logs every SECONDS (default: 60) '
+                             'and update figures')
+    parser.add_argument('--downsample', type=int, nargs='?', const=0, dest='max_points', metavar='N',
+                        help='plot about N points per series (default: a min and a max per pixel column), '
+                             'full resolution coming back when zooming')
+    parser.add_argument('--profile', action='store_true',
+                        help='print wall time and calls per stage and per disk, and peak RSS, to stderr')
+    parser.add_argument('--profile-memory', action='store_true',
+                        help='also trace peak allocated memory per stage, slowing it down (implies --profile)')
+    parser.add_argument('--profile-json', metavar='FILE',
+                        help='also write the --profile summary to FILE, as JSON (implies --profile)')
+    parser.add_argument('--summary', action='store_const', const='text',
+                        help='print the latest values and RAW_VALUE changes of each disk instead of plotting; '
+                             'exit status is 0 (OK), 1 (WARNING) or 2 (FAILING)')
+    parser.add_argument('--json', action='store_const', const='json', dest='summary',
+                        help='print the summary (or the --at-risk report) as JSON')
+    parser.add_argument('--at-risk', action='store_true',
+                        help='print the disks whose VALUE is projected to reach THRESH within the horizon, or whose '
+                             'critical RAW_VALUE growth accelerates; exit status is 1 when there is any')
+    parser.add_argument('--trend-window', type=float, default=TREND_WINDOW, metavar='DAYS',
+                        help=f'fit trends over the latest DAYS of each disk, and the DAYS before (default: {TREND_WINDOW})')
+    parser.add_argument('--horizon', type=float, default=TREND_HORIZON, metavar='DAYS',
+                        help=f'--at-risk projection horizon (default: {TREND_HORIZON} days)')
+    parser.add_argument('--fleet', action='store_true',
+                        help='all disks in a single figure: critical attributes heatmaps, sorted by risk; click on a '
+                             'disk for its own figure (with --batch, per-disk figures are rendered as well)')
+    parser.add_argument('--compact', type=parse_DATE_ARGUMENT, metavar='DATE',
+                        help='roll up the logs of the whole periods before DATE (e.g. 365d) into one aggregate per '
+                             f'disk and period, instead of plotting; LOGFILE arguments are then {SMART_DIR}/SN '
+                             'directories (default: all of them)')
+    parser.add_argument('--period', choices=list(AGGREGATE_PERIODS), default='week',
+                        help='--compact period (default: week)')
+    parser.add_argument('--serve', type=int, metavar='PORT',
+                        help='keep the latest state of each disk in memory, updated as new logs come (every --follow '
+                             'SECONDS), and serve it on PORT: /metrics (Prometheus), /json and /json/SN')
+    parser.add_argument('--bind', default=SERVE_ADDRESS, metavar='ADDRESS',
+                        help=f'address --serve listens on (default: {SERVE_ADDRESS})')
+    parser.add_argument('--root', default=SMART_DIR, metavar='DIR',
+                        help=f'directory of the logs, one sub-directory per disk (default: {SMART_DIR})')
+    parser.add_argument('--batch', action='store_true',
+                        help='render figures without any display, one PNG file per disk')
+    parser.add_argument('--outdir', default='.', metavar='DIR',
+                        help='directory where batch mode saves figures (default: current directory)')
+
+    return parser, parser.parse_args(argv)
 
 def main():
-    if __debug__:
+    parser, args = parse_arguments()
+
+    # stdout of summaries is meant to be read by other programs, --serve and --compact
+    # are rather run as services or from cron
+    if (__debug__ and args.summary is None and not args.at_risk
+            and args.serve is None and args.compact is None):
+        print("DEBUG mode is enabled. Use -O flag to disable it")
+        print()
+        print('Helpful information about SMART can be found in https://www.linuxjournal.com/article/6983')
+        print()
         print(SMART_DATA_EXAMPLE)
-        print(f'# {PATTERN_for_SLICING_SMART_DATA}')
         print()
 
-    if len(sys.argv[1:]) == 0:
-        print_usage()
-        list_of_lognames = glob(SMART_DIR + '/*/*.txt')
+    if args.profile or args.profile_memory or args.profile_json:
+        enable_PROFILE(args.profile_memory)
+
+    try:
+        return run(parser, args)
+    finally:
+        if PROFILE is not None:
+            print_PROFILE(args.profile_json)
+
+def run(parser, args):
+    whole_history = len(args.lognames) == 0 and args.serials is None and args.since is None and args.until is None
+
+    if args.compact is not None:
+        if len(args.lognames) == 0:
+            directories = sorted(os.path.join(args.root, disk_SN) for disk_SN in args.serials or os.listdir(args.root))
+        else:
+            directories = args.lognames
+
+        compact_SMART_DIRS([directory for directory in directories if os.path.isdir(directory)],
+                           args.compact, args.period)
+        return
+
+    if args.follow is not None or args.serve is not None:
+        watch = new_LOG_WATCH(args.root, args.serials)
+
+    if len(args.lognames) == 0:
+        if args.summary is None and not args.at_risk and args.serve is None:
+            parser.print_usage()
+        with profile_stage('glob'):
+            list_of_lognames = list_SMART_LOGS(args.root, args.serials, args.since, args.until)
     else:
-        list_of_lognames = sys.argv[1:]
+        list_of_lognames = args.lognames
 
     list_of_lognames.sort()
 
     # print(list_of_lognames)
 
-    smart_infos = dict()
-    for logname in list_of_lognames:
-        # print(logname, end='\r')
-        
-        with open(logname, 'r') as fp:
-            smart_data  = parse_START_OF_INFORMATION_SECTION    (fp, smart_infos)
+    cache_name   = None if args.no_cache else args.cache
+    render_cache = None if args.no_cache else args.render_cache
+
+    jobs = args.jobs if args.jobs > 0 else os.cpu_count()
 
-            ret_status  = parse_START_OF_READ_SMART_DATA_SECTION(fp, smart_data)
+    quarantine  = dict()
+    smart_infos = load_SMART_INFOS(list_of_lognames, cache_name, args.rebuild_cache, jobs, args.date_from_filename,
+                                   to_attribute_ids(args.attributes), args.since, args.until, prune_cache=whole_history,
+                                   quarantine=quarantine)
+
+    if args.quarantine is not None:
+        with open(args.quarantine, 'w') as fp:
+            json.dump(quarantine, fp, indent=4)
 
     # print(json.dumps(smart_infos, indent=4))
 
-    plot_SMART_INFOS(smart_infos)
+    if args.at_risk:
+        return print_TRENDS(build_TRENDS(smart_infos, args.trend_window, args.horizon), args.summary or 'text')
+    elif args.summary is not None:
+        return print_SUMMARY(smart_infos, args.summary)
+    elif args.serve is not None:
+        window = None if args.since is None else time.time() - args.since
+        serve_SMART_INFOS(smart_infos, watch, args.follow or 60, args.bind, args.serve,
+                          args.date_from_filename, to_attribute_ids(args.attributes), window)
+    elif args.follow is not None:
+        follow_SMART_INFOS(smart_infos, watch, args.follow, args.batch, args.outdir, args.max_points,
+                           args.date_from_filename, to_attribute_ids(args.attributes), args.since, args.until,
+                           render_cache)
+    elif args.fleet:
+        with profile_stage('fleet'):
+            fleet = build_FLEET(smart_infos)
+
+        if len(fleet['attribute_ids']) == 0:
+            print('    WARNING: no attribute loaded, no fleet overview', file=sys.stderr)
+        elif args.batch:
+            render_FLEET(fleet, args.outdir)
+            render_SMART_INFOS(smart_infos, args.outdir, jobs, args.max_points, render_cache)
+        else:
+            plot_FLEET(smart_infos, fleet, args.max_points)
+    elif args.batch:
+        render_SMART_INFOS(smart_infos, args.outdir, jobs, args.max_points, render_cache)
+    else:
+        plot_SMART_INFOS(smart_infos, args.max_points, render_cache)
 
 if __name__ == '__main__':
-    if __debug__:
-        print("DEBUG mode is enabled. Use -O flag to disable it")
-        print()
-        print('Helpful information about SMART can be found in https://www.linuxjournal.com/article/6983')
-        print()
-
-    main()
+    sys.exit(main())